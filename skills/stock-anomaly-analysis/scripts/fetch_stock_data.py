@@ -2,6 +2,7 @@
 """
 股票数据获取脚本
 数据来源：腾讯财经、东方财富
+所有请求经 request_scheduler 按主机调度 (自适应并发、退避重试、熔断)
 """
 
 import sys
@@ -9,7 +10,7 @@ import io
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-import requests
+from request_scheduler import http_get
 import json
 import re
 from datetime import datetime
@@ -47,7 +48,7 @@ def fetch_realtime_quote_tencent(stock_code: str) -> dict:
     url = f"https://qt.gtimg.cn/q={exchange}{code}"
     
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_get(url)
         resp.encoding = 'gbk'
         text = resp.text
         
@@ -110,7 +111,7 @@ def fetch_fund_flow_eastmoney(stock_code: str) -> dict:
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         data = resp.json()
         
         if data.get('data') and data['data'].get('klines'):
@@ -153,7 +154,7 @@ def fetch_dragon_tiger_eastmoney(stock_code: str, date: str = None) -> dict:
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         data = resp.json()
         
         if data.get('result') and data['result'].get('data'):
@@ -211,7 +212,7 @@ def fetch_kline_eastmoney(stock_code: str, period: str = "daily", limit: int = 3
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         data = resp.json()
         
         if data.get('data') and data['data'].get('klines'):
@@ -265,7 +266,7 @@ def fetch_market_indices() -> dict:
     url = f"https://qt.gtimg.cn/q={codes}"
     
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_get(url)
         resp.encoding = 'gbk'
         text = resp.text
         
@@ -496,7 +497,7 @@ def fetch_stock_sectors_eastmoney(stock_code: str) -> dict:
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         data = resp.json()
         
         if data.get('result') and data['result'].get('data'):
@@ -538,7 +539,7 @@ def fetch_sector_stocks_eastmoney(sector_code: str, limit: int = 50) -> dict:
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         data = resp.json()
         
         if data.get('data') and data['data'].get('diff'):
@@ -590,7 +591,7 @@ def fetch_hot_sectors_eastmoney(sector_type: str = "concept", limit: int = 20) -
     }
     
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_get(url, params=params)
         data = resp.json()
         
         if data.get('data') and data['data'].get('diff'):
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+共享请求调度层
+所有行情接口请求按主机 (host) 调度:
+- 自适应并发 (AIMD): 请求成功且延迟正常时并发上限缓慢增加 (每轮约 +1; 只在发出时并发窗口已占满才增加,
+  调用方并发不足时上限不会空涨), 出错、限流 (429/5xx) 或延迟明显高于基线时减半, 吞吐跟随上游当前的承受能力
+- 重试: 只重试超时/连接错误/429/5xx, 指数退避 + 全抖动 (full jitter), 优先遵循 Retry-After
+- 熔断: 连续失败达到阈值后在冷却期内直接拒绝 (CircuitOpenError, 不发出请求),
+  冷却结束后以并发1放行探测请求, 成功即恢复; 调用方可据此提前切换到备用数据源
+- 共享一个 keep-alive 连接池
+"""
+
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """主机处于熔断期, 请求未发出"""
+
+
+class HostState:
+    """单个主机的并发上限、延迟统计与熔断状态"""
+
+    def __init__(self, initial: int, max_limit: int):
+        self.limit = float(min(initial, max_limit))
+        self.max_limit = max_limit
+        self.inflight = 0
+        self.cond = threading.Condition()
+        self.latency = None       # 延迟 EWMA (秒)
+        self.baseline = None      # 近似无负载延迟: EWMA 的低位, 缓慢回升
+        self.failures = 0         # 连续失败次数
+        self.open_until = 0.0     # 熔断截止时间
+        self.half_open = False    # 冷却后的探测阶段, 并发为1
+        self.last_decrease = 0.0
+
+    def window(self) -> int:
+        return 1 if self.half_open else max(1, int(self.limit))
+
+
+class RequestScheduler:
+    def __init__(self, max_concurrency: int = 16, initial_concurrency: int = 4,
+                 timeout=(3.05, 10), retries: int = 3, backoff: float = 0.5, backoff_cap: float = 8.0,
+                 failure_threshold: int = 5, cooldown: float = 30.0, latency_factor: float = 2.0):
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = initial_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency_factor = latency_factor
+        self.session = requests.Session()
+        self._mount_pool()
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _mount_pool(self):
+        """连接池容量不小于并发上限, 否则超出池容量的连接用完即被丢弃, 无法复用"""
+        self._pool_size = max(self.max_concurrency, 16)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self._pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def configure(self, **kwargs):
+        """调整参数 (如 max_concurrency/timeout/retries); 已有主机的并发上限与连接池容量同步更新"""
+        for key, value in kwargs.items():
+            if value is not None:
+                setattr(self, key, value)
+        if max(self.max_concurrency, 16) != self._pool_size:
+            self._mount_pool()
+        with self._lock:
+            for state in self._hosts.values():
+                with state.cond:
+                    state.max_limit = self.max_concurrency
+                    state.limit = min(state.limit, self.max_concurrency)
+
+    # ---------- 主机状态 ----------
+
+    def _host(self, url: str) -> HostState:
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = HostState(self.initial_concurrency, self.max_concurrency)
+            return state
+
+    def available(self, url: str) -> bool:
+        """主机未处于熔断期"""
+        return self._host(url).open_until <= time.monotonic()
+
+    def stats(self, url: str) -> dict:
+        state = self._host(url)
+        return {
+            "limit": round(state.limit, 2), "inflight": state.inflight, "latency": state.latency,
+            "failures": state.failures, "open": not self.available(url),
+        }
+
+    def _acquire(self, state: HostState) -> bool:
+        """占用一个并发名额, 返回占用后窗口是否已满"""
+        with state.cond:
+            while True:
+                now = time.monotonic()
+                if state.open_until > now:
+                    raise CircuitOpenError(f"熔断中, {state.open_until - now:.0f}秒后重试")
+                if state.open_until:
+                    state.half_open = True
+                if state.inflight < state.window():
+                    state.inflight += 1
+                    return state.inflight >= state.window()
+                state.cond.wait(0.5)
+
+    def _decrease(self, state: HostState, now: float):
+        # 同一轮请求内的多个失败只减半一次
+        if now - state.last_decrease >= max(state.latency or 0.0, 0.5):
+            state.limit = max(1.0, state.limit / 2)
+            state.last_decrease = now
+
+    def _release(self, state: HostState, elapsed, ok: bool, saturated: bool = False):
+        with state.cond:
+            now = time.monotonic()
+            state.inflight -= 1
+            if ok:
+                state.failures = 0
+                state.half_open = False
+                state.open_until = 0.0
+                state.latency = elapsed if state.latency is None else 0.8 * state.latency + 0.2 * elapsed
+                if state.baseline is None or state.latency < state.baseline:
+                    state.baseline = state.latency
+                else:
+                    state.baseline += 0.01 * (state.latency - state.baseline)
+                if state.latency > self.latency_factor * state.baseline:
+                    self._decrease(state, now)
+                elif saturated:
+                    state.limit = min(state.max_limit, state.limit + 1 / state.limit)
+            else:
+                state.failures += 1
+                self._decrease(state, now)
+                if state.half_open or state.failures >= self.failure_threshold:
+                    state.open_until = now + self.cooldown
+                    state.half_open = False
+            state.cond.notify_all()
+
+    # ---------- 请求 ----------
+
+    def _backoff(self, attempt: int, response=None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(self.backoff_cap, float(retry_after))
+        return random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt))
+
+    def request(self, method: str, url: str, timeout=None, retries: int = None, **kwargs) -> requests.Response:
+        """
+        发出请求, 可重试错误按退避重试。非重试类的HTTP响应 (如404) 原样返回;
+        重试耗尽后抛出最后一次的异常, 熔断中抛出 CircuitOpenError。
+        """
+        state = self._host(url)
+        attempts = self.retries if retries is None else retries
+        for attempt in range(attempts + 1):
+            saturated = self._acquire(state)
+            start = time.monotonic()
+            response = None
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._release(state, None, ok=False)
+                error = e
+            except BaseException:
+                self._release(state, None, ok=False)
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    self._release(state, time.monotonic() - start, ok=True, saturated=saturated)
+                    return response
+                self._release(state, None, ok=False)
+                error = requests.HTTPError(f"HTTP {response.status_code}", response=response)
+            if attempt < attempts:
+                time.sleep(self._backoff(attempt, response))
+        raise error
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler() -> RequestScheduler:
+    """进程内共享的调度器"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = RequestScheduler()
+        return _default
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    return default_scheduler().get(url, **kwargs)
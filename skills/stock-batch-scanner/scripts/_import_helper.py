@@ -34,3 +34,6 @@ fetch_kline_eastmoney = _mod.fetch_kline_eastmoney
 get_exchange_prefix = _mod.get_exchange_prefix
 fetch_realtime_quote_tencent = _mod.fetch_realtime_quote_tencent
 calculate_technical_indicators = _mod.calculate_technical_indicators
+
+# 共享请求调度层与 fetch_stock_data 位于同一目录 (导入后已在 sys.path 中), 无IO副作用可直接导入
+from request_scheduler import CircuitOpenError, default_scheduler, http_get
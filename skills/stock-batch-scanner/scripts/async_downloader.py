@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+异步批量下载
+- 有界并发窗口: 至多 concurrency 个请求在途; 实际并发再由请求调度层按主机自适应收放
+  (见 stock-anomaly-analysis/scripts/request_scheduler.py, 连接池也由其共享)
+- 可选全局令牌桶: 配置 rate 时整体请求速率不超过 rate 次/秒, 作为硬上限
+- 结果到达即回调 (在事件循环线程中串行执行, 可直接写入存储)
+请求本身是同步调用, 通过 run_in_executor 在线程池中执行。
+fetch 可注入。
+"""
+
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """令牌桶: 每秒补充 rate 个令牌, 最多累积 burst 个; acquire() 在协程中等待令牌"""
+
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self._lock = None
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # 排队取令牌, 先到先得
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def download_async(items, fetch, on_result, rate: float = None, burst: int = 1,
+                         concurrency: int = 16) -> dict:
+    """
+    对 items 逐个调用 fetch(item), 配置 rate 时每个请求先从令牌桶取令牌, 在途不超过 concurrency;
+    每个结果到达即调用 on_result(item, result), fetch 抛出的异常以 {"error": str} 交给回调。
+    返回 {"count", "seconds"}。
+    """
+    bucket = TokenBucket(rate, burst) if rate else None
+    loop = asyncio.get_running_loop()
+    pending = iter(items)
+    count = 0
+    start = time.monotonic()
+
+    async def worker():
+        nonlocal count
+        # 共享迭代器: 事件循环单线程, 各 worker 依次取下一项
+        for item in pending:
+            if bucket:
+                await bucket.acquire()
+            try:
+                result = await loop.run_in_executor(executor, fetch, item)
+            except Exception as e:
+                result = {"error": str(e)}
+            count += 1
+            on_result(item, result)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"count": count, "seconds": round(time.monotonic() - start, 2)}
+
+
+def download(items, fetch, on_result, **kwargs) -> dict:
+    """download_async 的同步入口"""
+    return asyncio.run(download_async(items, fetch, on_result, **kwargs))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+三重筛选历史回测
+在本地K线上对每只股票、每个历史交易日按当时可见的数据重放
+近期涨停 (has_limit_up) / 多头排列 (is_multi_head) / 右侧买点 (is_right_side_buy),
+整段历史以 (stocks × bars) 矩阵沿时间轴一次计算, 不按日重复扫描。
+对每个信号统计持有N日的收益与持有期最大回撤, 汇总胜率、盈亏比、期望值。
+
+入场价为信号日收盘价; 持有期回撤 = 持有期内最低价相对入场价的最大跌幅。
+持有期内出现超出涨跌幅限制的价格缺口 (不复权数据上的除权除息) 的信号不计入, 否则送转/分红会被算成亏损。
+回测区间按交易日期划定 (最近 eval_bars 个交易日), 信号与同期基准取同一组日期, 停牌股票不会错位。
+ST 状态取当前股票名称, 不回溯历史上的摘帽/戴帽。
+"""
+
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from data_provider import DataProvider, load_config
+from indicators import rolling_mean_2d
+from kline_store import format_date
+from limit_price import beyond_limit_mask, limit_ratios, limit_up_mask
+from vector_scan import align_market
+
+
+DEFAULT_HORIZONS = (5, 10, 20)
+TRADING_DAYS_PER_YEAR = 250
+
+
+# ============================================================
+# 时间轴上的矩阵运算: 第 t 列只使用第 t 列及之前的数据
+# ============================================================
+
+def lag(mat: np.ndarray, k: int) -> np.ndarray:
+    """k 根K线之前的值, 前 k 列为NaN"""
+    if k == 0:
+        return mat
+    out = np.full(mat.shape, np.nan)
+    out[:, k:] = mat[:, :-k]
+    return out
+
+
+def lead(mat: np.ndarray, k: int) -> np.ndarray:
+    """k 根K线之后的值, 末 k 列为NaN (仅用于计算远期收益)"""
+    out = np.full(mat.shape, np.nan)
+    out[:, :-k] = mat[:, k:]
+    return out
+
+
+def rolling_count(mask: np.ndarray, window: int) -> np.ndarray:
+    """截至每列的最近 window 列中 True 的个数"""
+    cs = np.zeros((mask.shape[0], mask.shape[1] + 1), dtype=np.int32)
+    np.cumsum(mask, axis=1, out=cs[:, 1:])
+    start = np.maximum(np.arange(mask.shape[1]) + 1 - window, 0)
+    return cs[:, 1:] - cs[:, start]
+
+
+def ma_matrix(close: np.ndarray, period: int) -> np.ndarray:
+    """与 close 同宽的 MA 矩阵, 第 t 列为截至 t 的 period 日均值, 不足为NaN"""
+    out = np.full(close.shape, np.nan)
+    means = rolling_mean_2d(close, period)
+    if means.shape[1]:
+        out[:, period - 1:] = means
+    return out
+
+
+def signal_matrix(codes: list, mats: dict, names: dict, lookback: int) -> np.ndarray:
+    """逐 (股票, 交易日) 的三重筛选信号, 判定规则同 batch_scanner / vector_scan"""
+    close, low = mats["close"], mats["low"]
+    valid = ~np.isnan(close)
+    bars_seen = np.cumsum(valid, axis=1)
+    limit = limit_up_mask(close, mats["change_pct"], limit_ratios(codes, names)) & valid
+    ma = {p: ma_matrix(close, p) for p in (5, 10, 20, 60)}
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        limit_up = (bars_seen >= 20) & (rolling_count(limit, lookback) > 0)
+
+        ordered3 = (ma[5] > ma[10]) & (ma[10] > ma[20])
+        multi_head = np.where(np.isnan(ma[60]), ordered3, ordered3 & (ma[20] > ma[60]))
+
+        touched = np.zeros(close.shape, dtype=bool)
+        for k in range(5):
+            low_k = lag(low, k)
+            touched |= (np.abs(low_k - ma[20]) / ma[20] < 0.03) | (np.abs(low_k - ma[10]) / ma[10] < 0.03)
+        right_side = (
+            (bars_seen >= 25)
+            & (ma[20] > lag(ma[20], 5))
+            & (close >= ma[10])
+            & (close >= ma[20])
+            & touched
+            & (close > mats["open"])
+        )
+    return limit_up & multi_head & right_side
+
+
+def forward_metrics(close: np.ndarray, low: np.ndarray, horizon: int, gaps: np.ndarray = None) -> tuple:
+    """
+    持有 horizon 日的 (收益率, 持有期最大回撤, 持有期跨价格缺口), 与 close 同形状;
+    信号日之后不足 horizon 根K线的位置为NaN。gaps 为逐日价格缺口 (除权除息) 掩码,
+    持有期 (t, t+horizon] 内含缺口的位置收益与回撤置为NaN。
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ret = lead(close, horizon) / close - 1
+        min_low = np.full(close.shape, np.nan)
+        if close.shape[1] > horizon:
+            window_min = sliding_window_view(low, horizon, axis=1).min(axis=2)
+            min_low[:, : close.shape[1] - horizon] = window_min[:, 1:]
+        drawdown = np.minimum(min_low / close - 1, 0)
+    crossed = np.zeros(close.shape, dtype=bool)
+    if gaps is not None:
+        crossed = lead(rolling_count(gaps, horizon).astype(np.float64), horizon) > 0
+        ret[crossed] = np.nan
+        drawdown[crossed] = np.nan
+    return ret, drawdown, crossed
+
+
+def window_start(dates: np.ndarray, eval_bars: int) -> tuple:
+    """交易日历 (dates 中出现过的全部日期) 上最近 eval_bars 个交易日的起始日期, 返回 (起始日期, 实际交易日数)"""
+    calendar = np.unique(dates[dates > 0])
+    if not len(calendar):
+        return 0, 0
+    days = min(eval_bars, len(calendar))
+    return int(calendar[-days]), days
+
+
+# ============================================================
+# 回测主体
+# ============================================================
+
+def run_backtest(chunks, names: dict, lookback: int = 40, eval_bars: int = TRADING_DAYS_PER_YEAR,
+                 horizons=DEFAULT_HORIZONS) -> dict:
+    """
+    chunks 逐批产出 {code: K线} (如 DataProvider.iter_series), 每批独立对齐计算, 内存与批大小成正比。
+    只统计最近 eval_bars 个交易日 (由第一批的交易日历确定起始日期, 各批共用) 的信号,
+    之前的K线用于均线/涨停回溯的预热; 持有期跨除权缺口的信号剔除, 同期基准同样处理。
+    返回 {"trades": 信号明细数组, "baseline": 同期全部股票的远期收益汇总, "stocks": 股票数,
+          "eval_start": 起始日期, "eval_days": 区间交易日数, "excluded": {持有期: 跨除权剔除的信号数}}
+    """
+    trades = {"code": [], "date": []}
+    trades.update({f"ret_{n}": [] for n in horizons})
+    trades.update({f"dd_{n}": [] for n in horizons})
+    baseline = {n: {"count": 0, "wins": 0, "sum": 0.0} for n in horizons}
+    excluded = {n: 0 for n in horizons}
+    stocks = 0
+    start = None
+    eval_days = 0
+
+    for chunk in chunks:
+        codes, mats, lengths = align_market(chunk)
+        if not codes:
+            continue
+        stocks += len(codes)
+        if start is None:
+            start, eval_days = window_start(mats["date"], eval_bars)
+        in_window = mats["date"] >= start
+        eligible = (np.cumsum(~np.isnan(mats["close"]), axis=1) >= 20) & in_window
+        signals = signal_matrix(codes, mats, names, lookback) & in_window
+        gaps = beyond_limit_mask(mats["change_pct"], limit_ratios(codes, names))
+        rows, cols = np.nonzero(signals)
+
+        trades["code"].extend(codes[i] for i in rows.tolist())
+        trades["date"].extend(format_date(int(d)) for d in mats["date"][rows, cols].tolist())
+        for n in horizons:
+            ret, drawdown, crossed = forward_metrics(mats["close"], mats["low"], n, gaps)
+            trades[f"ret_{n}"].append(ret[rows, cols])
+            trades[f"dd_{n}"].append(drawdown[rows, cols])
+            excluded[n] += int(crossed[rows, cols].sum())
+            base = ret[eligible & ~np.isnan(ret)]
+            baseline[n]["count"] += len(base)
+            baseline[n]["wins"] += int((base > 0).sum())
+            baseline[n]["sum"] += float(base.sum())
+
+    for n in horizons:
+        for key in (f"ret_{n}", f"dd_{n}"):
+            trades[key] = np.concatenate(trades[key]) if trades[key] else np.zeros(0)
+    return {
+        "trades": trades, "baseline": baseline, "stocks": stocks,
+        "eval_start": format_date(start) if start else "", "eval_days": eval_days, "excluded": excluded,
+    }
+
+
+def summarize(returns: np.ndarray, drawdowns: np.ndarray) -> dict:
+    """胜率 / 平均盈亏 / 盈亏比 / 期望值 / 回撤, 只统计持有期已走完的信号"""
+    done = ~np.isnan(returns)
+    r, dd = returns[done], drawdowns[done]
+    if not len(r):
+        return {"count": 0}
+    wins, losses = r[r > 0], r[r <= 0]
+    avg_win = float(wins.mean()) if len(wins) else 0.0
+    avg_loss = float(-losses.mean()) if len(losses) else 0.0
+    return {
+        "count": int(len(r)),
+        "win_rate": round(len(wins) / len(r) * 100, 2),
+        "avg_return": round(float(r.mean()) * 100, 2),
+        "median_return": round(float(np.median(r)) * 100, 2),
+        "avg_win": round(avg_win * 100, 2),
+        "avg_loss": round(avg_loss * 100, 2),
+        "profit_loss_ratio": round(avg_win / avg_loss, 2) if avg_loss else None,
+        "expectancy": round((len(wins) * avg_win - len(losses) * avg_loss) / len(r) * 100, 2),
+        "avg_drawdown": round(float(dd.mean()) * 100, 2),
+        "max_drawdown": round(float(dd.min()) * 100, 2),
+    }
+
+
+def build_report(outcome: dict, lookback: int, eval_bars: int, horizons) -> dict:
+    trades = outcome["trades"]
+    report = {
+        "generated": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "stocks": outcome["stocks"],
+        "eval_bars": eval_bars,
+        "eval_start": outcome["eval_start"],
+        "eval_days": outcome["eval_days"],
+        "lookback": lookback,
+        "signals": len(trades["code"]),
+        "signal_days": len(set(trades["date"])),
+        "horizons": {},
+        "by_year": {},
+    }
+    for n in horizons:
+        summary = summarize(trades[f"ret_{n}"], trades[f"dd_{n}"])
+        base = outcome["baseline"][n]
+        if base["count"]:
+            summary["baseline_win_rate"] = round(base["wins"] / base["count"] * 100, 2)
+            summary["baseline_avg_return"] = round(base["sum"] / base["count"] * 100, 2)
+        summary["ex_rights_excluded"] = outcome["excluded"][n]
+        report["horizons"][str(n)] = summary
+
+    years = np.array([d[:4] for d in trades["date"]])
+    main = horizons[0]
+    for year in sorted(set(years.tolist())):
+        sel = years == year
+        report["by_year"][year] = summarize(trades[f"ret_{main}"][sel], trades[f"dd_{main}"][sel])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="三重筛选历史回测")
+    parser.add_argument("--config", default=None, help="配置文件路径")
+    parser.add_argument("--years", type=float, default=1, help="回测区间 (年, 默认1)")
+    parser.add_argument("--horizons", default="5,10,20", help="持有天数, 逗号分隔 (默认5,10,20)")
+    parser.add_argument("--days", type=int, default=None, help="涨停回溯天数 (默认从config读取)")
+    parser.add_argument("--chunk", type=int, default=1000, help="每批计算的股票数")
+    parser.add_argument("--trades", default=None, help="信号明细输出CSV路径 (可选)")
+    parser.add_argument("-o", "--output", default="backtest.json", help="回测报告输出路径")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    provider = DataProvider(args.config)
+    if not provider.has_local_data():
+        print("⚠ 无本地K线数据, 请先运行 sync_klines.py --init 或配置 tdx_path")
+        return
+
+    lookback = args.days or config.get("scan_lookback_days", 40)
+    horizons = tuple(int(h) for h in args.horizons.split(",") if h)
+    eval_bars = int(args.years * TRADING_DAYS_PER_YEAR)
+    # 预热: MA60 + MA20五日斜率 + 涨停回溯, 再留出最长持有期的远期数据
+    load_bars = eval_bars + max(60, lookback) + 10
+
+    print(f"📂 数据源: {provider.get_source_info()}")
+    print(f"📊 回测区间: 最近{eval_bars}个交易日, 持有期 {horizons}, 涨停回溯{lookback}日")
+    start = time.time()
+    outcome = run_backtest(
+        provider.iter_series(days=load_bars, chunk_size=args.chunk),
+        provider.get_stock_list(), lookback, eval_bars, horizons,
+    )
+    if outcome["eval_days"] < eval_bars:
+        print(f"⚠ 本地K线只覆盖 {outcome['eval_days']} 个交易日, 少于回测区间 {eval_bars} 日, "
+              f"实际回测 {outcome['eval_start']} 起的 {outcome['eval_days']} 日")
+    report = build_report(outcome, lookback, eval_bars, horizons)
+    report["source"] = provider.get_source_info()
+    report["elapsed_seconds"] = round(time.time() - start, 1)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.trades:
+        trades = outcome["trades"]
+        with open(args.trades, "w", encoding="utf-8") as f:
+            f.write(",".join(["code", "date"] + [f"{k}_{n}" for n in horizons for k in ("ret", "dd")]) + "\n")
+            for i, (code, date) in enumerate(zip(trades["code"], trades["date"])):
+                values = [f"{trades[f'{k}_{n}'][i] * 100:.2f}" for n in horizons for k in ("ret", "dd")]
+                f.write(",".join([code, date] + values) + "\n")
+
+    print(f"\n✅ 回测完成: {report['stocks']}只股票, {report['signals']}个信号 "
+          f"({report['signal_days']}个交易日, 区间自 {report['eval_start']}), 耗时 {report['elapsed_seconds']}秒")
+    print(f"\n📊 持有期统计 (收益%):")
+    for n, s in report["horizons"].items():
+        if not s.get("count"):
+            print(f"  {n:>3}日: 无已完成信号")
+            continue
+        mark = "✅" if s["win_rate"] >= 40 else "⚠"
+        print(f"  {n:>3}日: 胜率 {s['win_rate']}% {mark}  平均 {s['avg_return']:+.2f}  "
+              f"盈亏比 {s['profit_loss_ratio']}  期望 {s['expectancy']:+.2f}  "
+              f"最大回撤 {s['max_drawdown']:.2f}  (基准胜率 {s.get('baseline_win_rate')}%)")
+        if s["ex_rights_excluded"]:
+            print(f"        持有期跨除权缺口剔除 {s['ex_rights_excluded']} 个信号")
+    print(f"💾 报告保存至 {output_path}")
+
+
+if __name__ == "__main__":
+    main()
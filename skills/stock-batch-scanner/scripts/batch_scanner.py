@@ -14,13 +14,18 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 SKILL_DIR = SCRIPT_DIR.parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
-from data_provider import DataProvider, load_config
+from data_provider import DataProvider, column_of, load_config
 from fetch_limit_up_pool import fetch_limit_up_pool
 from _import_helper import fetch_kline_eastmoney
+from indicators import latest_mas, ma_table, rolling_mean
+from limit_price import limit_ratio, limit_up_mask
+from vector_scan import MarketFrame, scan_market, scan_stream
 
 
 # ============================================================
@@ -28,41 +33,27 @@ from _import_helper import fetch_kline_eastmoney
 # ============================================================
 
 def compute_ma(closes: list, period: int):
-    if len(closes) < period:
-        return None
-    return sum(closes[-period:]) / period
+    return latest_mas(closes, (period,))[period]
 
 
 def compute_ma_series(closes: list, period: int) -> list:
     """计算MA序列 (长度 = len(closes) - period + 1)"""
-    if len(closes) < period:
-        return []
-    series = []
-    for i in range(period - 1, len(closes)):
-        series.append(sum(closes[i - period + 1 : i + 1]) / period)
-    return series
+    return rolling_mean(closes, period).tolist()
 
 
 # ============================================================
 # 三重筛选
 # ============================================================
 
-def has_limit_up(klines: list, lookback_days: int = 40) -> dict:
+def has_limit_up(klines: list, lookback_days: int = 40, code: str = "", name: str = "") -> dict:
     """
     检查近N日是否有涨停。
     返回: {"passed": bool, "dates": [str], "count": int}
-    主板涨跌幅限制10%, 创业板/科创板20%
+    按板块涨停价判定: 主板10%, 创业板/科创板20%, ST 5% (见 limit_price)
     """
-    recent = klines[-lookback_days:] if len(klines) > lookback_days else klines
-    limit_dates = []
-    for k in recent:
-        code = ""
-        threshold = 9.8
-        pct = k.get("change_pct", 0)
-        if pct >= 19.5:
-            limit_dates.append(k["date"])
-        elif pct >= threshold:
-            limit_dates.append(k["date"])
+    hits = limit_up_mask(column_of(klines, "close"), column_of(klines, "change_pct", 0), limit_ratio(code, name))
+    start = max(len(klines) - lookback_days, 0)
+    limit_dates = [klines[i]["date"] for i in np.flatnonzero(hits[start:]) + start]
     return {
         "passed": len(limit_dates) > 0,
         "dates": limit_dates,
@@ -75,11 +66,8 @@ def is_multi_head(klines: list) -> dict:
     检查多头排列: MA5 > MA10 > MA20 > MA60
     返回: {"passed": bool, "ma5": float, "ma10": float, "ma20": float, "ma60": float}
     """
-    closes = [k["close"] for k in klines]
-    ma5 = compute_ma(closes, 5)
-    ma10 = compute_ma(closes, 10)
-    ma20 = compute_ma(closes, 20)
-    ma60 = compute_ma(closes, 60)
+    mas = latest_mas(column_of(klines, "close"))
+    ma5, ma10, ma20, ma60 = mas[5], mas[10], mas[20], mas[60]
 
     passed = False
     if ma5 and ma10 and ma20 and ma60:
@@ -104,17 +92,18 @@ def is_right_side_buy(klines: list) -> dict:
     3. 近5日低点曾触及MA10/MA20附近(±3%)
     4. 最新K线阳线确认
     """
-    closes = [k["close"] for k in klines]
+    closes = column_of(klines, "close")
     if len(closes) < 25:
         return {"passed": False, "reason": "数据不足"}
 
-    ma20_series = compute_ma_series(closes, 20)
+    mas = ma_table(closes, (10, 20))
+    ma20_series = mas[20]
     if len(ma20_series) < 6:
         return {"passed": False, "reason": "MA20序列不足"}
 
-    ma20_now = ma20_series[-1]
-    ma20_5d_ago = ma20_series[-6]
-    ma10 = compute_ma(closes, 10)
+    ma20_now = float(ma20_series[-1])
+    ma20_5d_ago = float(ma20_series[-6])
+    ma10 = float(mas[10][-1])
     current_close = closes[-1]
 
     if ma20_now <= ma20_5d_ago:
@@ -123,7 +112,7 @@ def is_right_side_buy(klines: list) -> dict:
     if current_close < ma10 or current_close < ma20_now:
         return {"passed": False, "reason": "价格未站上均线"}
 
-    recent_lows = [k["low"] for k in klines[-5:]]
+    recent_lows = column_of(klines[-5:], "low")
     touched_ma20 = any(abs(low - ma20_now) / ma20_now < 0.03 for low in recent_lows)
     touched_ma10 = any(abs(low - ma10) / ma10 < 0.03 for low in recent_lows) if ma10 else False
     if not (touched_ma20 or touched_ma10):
@@ -139,8 +128,8 @@ def is_right_side_buy(klines: list) -> dict:
     }
 
 
-def compute_score(klines: list, limit_up_info: dict, multi_head: dict, right_side: dict) -> float:
-    """综合评分 0-100"""
+def compute_score(klines: list, limit_up_info: dict, multi_head: dict, right_side: dict, closes: list = None) -> float:
+    """综合评分 0-100 (closes 可由调用方传入, 避免重复提取)"""
     score = 0
     score += min(limit_up_info["count"] * 15, 30)
 
@@ -155,7 +144,8 @@ def compute_score(klines: list, limit_up_info: dict, multi_head: dict, right_sid
         if slope > 1:
             score += min(slope * 2, 10)
 
-    closes = [k["close"] for k in klines]
+    if closes is None:
+        closes = column_of(klines, "close")
     if len(closes) >= 6:
         change_5d = (closes[-1] / closes[-6] - 1) * 100
         if 5 < change_5d < 25:
@@ -164,12 +154,12 @@ def compute_score(klines: list, limit_up_info: dict, multi_head: dict, right_sid
     return round(min(score, 100), 1)
 
 
-def scan_stock(code, klines, lookback_days=40):
-    """对单只股票执行三重筛选，返回结果或None(未通过)"""
+def scan_stock(code, klines, lookback_days=40, name=""):
+    """对单只股票执行三重筛选，返回结果或None(未通过); name 用于识别 ST 的5%涨停幅度"""
     if not klines or len(klines) < 20:
         return None
 
-    limit_up = has_limit_up(klines, lookback_days)
+    limit_up = has_limit_up(klines, lookback_days, code, name)
     if not limit_up["passed"]:
         return None
 
@@ -181,8 +171,8 @@ def scan_stock(code, klines, lookback_days=40):
     if not right_side["passed"]:
         return None
 
-    score = compute_score(klines, limit_up, multi_head, right_side)
-    closes = [k["close"] for k in klines]
+    closes = column_of(klines, "close")
+    score = compute_score(klines, limit_up, multi_head, right_side, closes)
     latest = klines[-1]
 
     def period_change(n):
@@ -214,23 +204,93 @@ def scan_stock(code, klines, lookback_days=40):
 # 主流程
 # ============================================================
 
-def scan_from_local(provider, config):
-    """路径A: 从本地数据扫描"""
-    lookback = config.get("scan_lookback_days", 40)
+def load_from_local(provider, config) -> tuple:
+    """路径A: 加载本地全市场K线, 返回 (all_klines, stock_list, 加载耗时秒)"""
     klines_days = config.get("klines_days", 70)
 
     print(f"📂 数据源: {provider.get_source_info()}")
     print(f"📊 加载本地K线数据...")
     start = time.time()
-    all_klines = provider.get_all_klines(days=klines_days)
-    print(f"  ✅ 加载 {len(all_klines)} 只股票, 耗时 {time.time()-start:.1f}秒")
+    all_klines = provider.get_all_series(days=klines_days)
+    load_seconds = time.time() - start
+    print(f"  ✅ 加载 {len(all_klines)} 只股票, 耗时 {load_seconds:.1f}秒")
+    return all_klines, provider.get_stock_list(), load_seconds
+
 
+def align_frame(all_klines: dict, stock_list: dict) -> tuple:
+    """全市场K线 → (MarketFrame, align 阶段计时)"""
+    start = time.perf_counter()
+    frame = MarketFrame(all_klines, names=stock_list)
+    return frame, {"stage": "align", "count": len(frame), "seconds": round(time.perf_counter() - start, 4)}
+
+
+def build_local_frame(provider, config) -> tuple:
+    """
+    路径A: 构造全市场 MarketFrame, 返回 (frame, stock_list, 前置阶段计时)。
+    增量指标状态与最近一次同步一致时直接由状态表构造, 跳过K线加载与均线计算;
+    否则完整加载K线, 并用本次结果重建状态供下次增量更新。
+    """
+    klines_days = config.get("klines_days", 70)
+    state = provider.indicator_state()
+    stamp = provider.sync_stamp()
+    start = time.perf_counter()
+    if state is not None and state.load(stamp, klines_days):
+        stock_list = provider.get_stock_list()
+        frame = MarketFrame.from_state(state, stock_list)
+        seconds = round(time.perf_counter() - start, 4)
+        print(f"📂 数据源: {provider.get_source_info()}")
+        print(f"⚡ 使用增量指标状态: {len(frame)} 只股票, 耗时 {seconds:.2f}秒 (跳过K线加载)")
+        return frame, stock_list, [{"stage": "state", "count": len(frame), "seconds": seconds}]
+
+    all_klines, stock_list, load_seconds = load_from_local(provider, config)
+    frame, align = align_frame(all_klines, stock_list)
+    stages = [{"stage": "load", "count": len(all_klines), "seconds": round(load_seconds, 4)}, align]
+    if state is not None and frame.mats["close"].shape[1] == klines_days:
+        start = time.perf_counter()
+        state.build(frame, stamp)
+        state.save()
+        stages.append({"stage": "state_build", "count": len(state), "seconds": round(time.perf_counter() - start, 4)})
+    return frame, stock_list, stages
+
+
+def _with_stages(stats: dict, stages: list) -> dict:
+    """用实际的前置阶段 (加载/对齐/状态) 替换 scan_market 在共享 frame 上记录的 align 项"""
+    stats["stages"] = stages + [t for t in stats["stages"] if t["stage"] != "align"]
+    return stats
+
+
+def _has_fresh_state(provider, config) -> bool:
+    state = provider.indicator_state()
+    return state is not None and state.load(provider.sync_stamp(), config.get("klines_days", 70))
+
+
+def stream_from_local(provider, config, top: int = None):
+    """路径A (流式): 按批加载本地K线, 边加载边由线程池筛选, 不一次性持有全市场"""
+    lookback = config.get("scan_lookback_days", 40)
+    chunk_size = config.get("stream_chunk", 500)
+    workers = config.get("stream_workers", 2)
+    print(f"📂 数据源: {provider.get_source_info()}")
+    print(f"🌊 流式扫描: 每批{chunk_size}只, {workers}个筛选线程")
     stock_list = provider.get_stock_list()
-    return _do_scan(all_klines, stock_list, lookback)
+    chunks = provider.iter_series(days=config.get("klines_days", 70), chunk_size=chunk_size)
+    print(f"\n🔍 执行{'自定义' if config.get('screen') else '三重'}筛选 (回溯{lookback}日)...")
+    results, stats = scan_stream(chunks, stock_list, lookback, config.get("screen"), workers, top)
+    _print_stats(stats, lookback)
+    return results, stats
 
 
-def scan_from_api(config):
-    """路径B: 无本地数据，从API涨停池预过滤"""
+def scan_from_local(provider, config, top: int = None):
+    """路径A: 从本地数据扫描 (增量指标状态可用时查表; 配置 scan_stream 时流式加载)"""
+    if config.get("scan_stream") and not _has_fresh_state(provider, config):
+        return stream_from_local(provider, config, top)
+    frame, stock_list, stages = build_local_frame(provider, config)
+    results, stats = _do_scan({}, stock_list, config.get("scan_lookback_days", 40), config.get("screen"),
+                              frame=frame, top=top)
+    return results, _with_stages(stats, stages)
+
+
+def load_from_api(config) -> tuple:
+    """路径B: 无本地数据，从API涨停池预过滤, 返回 (all_klines, stock_list)"""
     lookback = config.get("scan_lookback_days", 40)
     klines_days = config.get("klines_days", 70)
     threads = config.get("api_threads", 5)
@@ -241,7 +301,7 @@ def scan_from_api(config):
     if not pool:
         print("⚠ 涨停池为空，且无本地数据")
         print("💡 建议先运行 sync_klines.py --init 建立本地数据库")
-        return []
+        return {}, {}
 
     print(f"\n📈 批量获取 {len(pool)} 只候选股K线 ({threads}线程)...")
     codes = list(pool.keys())
@@ -283,54 +343,148 @@ def scan_from_api(config):
     provider = DataProvider()
     for code, kl in all_klines.items():
         provider.save_kline(code, stock_list.get(code, ""), kl)
+    provider.flush()
     provider.save_stock_list(stock_list)
     provider.update_sync_meta(
         last_api_scan=datetime.now().isoformat(),
         api_scan_count=len(all_klines),
     )
     print(f"  ✅ 获取 {len(all_klines)} 只K线, 耗时 {(time.time()-start)/60:.1f}分钟")
-    return _do_scan(all_klines, stock_list, lookback)
+    return all_klines, stock_list
 
 
-def _do_scan(all_klines: dict, stock_list: dict, lookback: int) -> list:
-    """执行三重筛选"""
-    print(f"\n🔍 执行三重筛选 (回溯{lookback}日)...")
-    results = []
-    stats = {"total": 0, "limit_up": 0, "multi_head": 0, "right_side": 0}
+def scan_from_api(config, top: int = None):
+    """路径B: 无本地数据，从API涨停池预过滤"""
+    all_klines, stock_list = load_from_api(config)
+    if not all_klines:
+        return [], {}
+    return _do_scan(all_klines, stock_list, config.get("scan_lookback_days", 40), config.get("screen"), top=top)
 
-    for code, klines in all_klines.items():
-        stats["total"] += 1
-        if not klines or len(klines) < 20:
-            continue
 
-        limit_up = has_limit_up(klines, lookback)
-        if not limit_up["passed"]:
-            continue
-        stats["limit_up"] += 1
+def _do_scan(all_klines: dict, stock_list: dict, lookback: int, screen: dict = None,
+             frame: MarketFrame = None, title: str = None, top: int = None) -> tuple:
+    """执行筛选 (全市场向量化, screen 缺省为三重筛选), 返回 (results, stats)"""
+    title = title or ("自定义筛选" if screen else "三重筛选")
+    print(f"\n🔍 执行{title} (回溯{lookback}日)...")
+    results, stats = scan_market(all_klines, stock_list, lookback, screen, frame, top)
+    _print_stats(stats, lookback)
+    return results, stats
 
-        multi_head = is_multi_head(klines)
-        if not multi_head["passed"]:
-            continue
-        stats["multi_head"] += 1
 
-        right_side = is_right_side_buy(klines)
-        if not right_side["passed"]:
-            continue
-        stats["right_side"] += 1
+def _print_stats(stats: dict, lookback: int):
+    labels = {"limit_up": f"近{lookback}日涨停", "multi_head": "多头排列", "right_side": "右侧买点"}
+    funnel = [t for t in stats["stages"] if t["stage"] not in ("load", "align", "eligible", "score", "merge")]
+    print(f"\n📊 筛选统计:")
+    print(f"  扫描总数:   {stats['total']}")
+    for n, t in enumerate(funnel):
+        tail = " ← 最终结果" if n == len(funnel) - 1 else ""
+        print(f"  {labels.get(t['stage'], t['stage'])}: {t['count']}{tail}")
+    print("  阶段耗时:   " + " → ".join(f"{t['stage']} {t['seconds']*1000:.1f}ms" for t in stats["stages"]))
+
 
-        result = scan_stock(code, klines, lookback)
-        if result:
-            result["name"] = stock_list.get(code, "")
-            results.append(result)
+def load_strategies(path: str, config: dict) -> list:
+    """
+    策略列表: --strategies 指定的JSON文件 (列表或 {"strategies": [...]}), 否则取 config 的 "strategies"。
+    每个策略形如 {"name", "scan_lookback_days", "screen", "top", "output"}, 未给出的项沿用 config。
+    """
+    if path:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        strategies = data.get("strategies", []) if isinstance(data, dict) else data
+    else:
+        strategies = config.get("strategies", [])
+    for i, strategy in enumerate(strategies):
+        strategy.setdefault("name", f"strategy{i + 1}")
+    return strategies
 
-    results.sort(key=lambda x: x["score"], reverse=True)
 
-    print(f"\n📊 筛选统计:")
-    print(f"  扫描总数:   {stats['total']}")
-    print(f"  近{lookback}日涨停: {stats['limit_up']}")
-    print(f"  多头排列:   {stats['multi_head']}")
-    print(f"  右侧买点:   {stats['right_side']} ← 最终结果")
-    return results
+def scan_strategies(frame: MarketFrame, stock_list: dict, strategies: list, config: dict, stages: list,
+                    top: int = None) -> list:
+    """
+    多策略单次扫描: 全市场只构造一次 MarketFrame, 均线、涨停命中等矩阵在策略间共享,
+    每个策略只增加自身筛选与评分的开销。返回 [(strategy, results, stats)]。
+    """
+    print(f"\n🧮 全市场矩阵: {len(frame)} 只 (供 {len(strategies)} 个策略共享)")
+    outcomes = []
+    for n, strategy in enumerate(strategies):
+        lookback = strategy.get("scan_lookback_days", config.get("scan_lookback_days", 40))
+        results, stats = _do_scan({}, stock_list, lookback, strategy.get("screen", config.get("screen")),
+                                  frame=frame, title=f"策略 [{strategy['name']}]", top=strategy.get("top", top))
+        # 加载/对齐开销只计入首个策略, 其余策略的 align 阶段标记为 shared
+        if n == 0:
+            _with_stages(stats, stages)
+        outcomes.append((strategy, results, stats))
+    return outcomes
+
+
+def _output_data(results: list, stats: dict, scan_mode: str, total: int) -> dict:
+    return {
+        "scan_date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        "scan_mode": scan_mode,
+        "total_scanned": total,
+        "result_count": len(results),
+        "stages": stats.get("stages", []),
+        "results": results,
+    }
+
+
+def _write_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def _print_top(results: list):
+    if results:
+        print(f"\n🏆 TOP 10:")
+        for i, r in enumerate(results[:10], 1):
+            print(f"  {i:2d}. {r['code']} {r['name']:8s} "
+                  f"¥{r['price']:.2f} ({r['change_pct']:+.2f}%) "
+                  f"评分{r['score']} "
+                  f"涨停{r['limit_up_count']}次 "
+                  f"5日{r['change_5d']:+.1f}%")
+
+
+def run_strategies(provider, config: dict, strategies: list, output: str, combined: bool, top: int = None):
+    """多策略模式: 加载一次数据, 每个策略一个结果文件 (或 combined 时合并写入 output)"""
+    start = time.time()
+    if provider.has_local_data():
+        scan_mode = "local"
+        frame, stock_list, stages = build_local_frame(provider, config)
+    else:
+        scan_mode = "api"
+        # API 路径的涨停池按最长回溯天数预过滤, 覆盖所有策略
+        api_config = dict(config)
+        api_config["scan_lookback_days"] = max(
+            s.get("scan_lookback_days", config.get("scan_lookback_days", 40)) for s in strategies)
+        all_klines, stock_list = load_from_api(api_config)
+        load = {"stage": "load", "count": len(all_klines), "seconds": round(time.time() - start, 4)}
+        frame, align = align_frame(all_klines, stock_list)
+        stages = [load, align]
+    if not len(frame):
+        print("⚠ 无可扫描的K线数据")
+        return
+
+    output_path = Path(output)
+    outcomes = scan_strategies(frame, stock_list, strategies, config, stages, top)
+    combined_data = {"scan_date": datetime.now().strftime("%Y-%m-%d %H:%M"), "strategies": []}
+
+    print(f"\n📋 策略汇总:")
+    for strategy, results, stats in outcomes:
+        data = _output_data(results, stats, scan_mode, stats.get("total", 0) if scan_mode == "local" else 0)
+        data["strategy"] = strategy["name"]
+        if combined:
+            combined_data["strategies"].append(data)
+            target = output_path
+        else:
+            target = Path(strategy.get("output") or output_path.with_name(
+                f"{output_path.stem}_{strategy['name']}{output_path.suffix}"))
+            _write_json(target, data)
+        print(f"  {strategy['name']}: {len(results)} 只 → {target}")
+    if combined:
+        _write_json(output_path, combined_data)
+
+    print(f"\n✅ {len(outcomes)} 个策略扫描完成, 总耗时 {time.time() - start:.1f}秒")
 
 
 def main():
@@ -339,46 +493,42 @@ def main():
     parser.add_argument("--days", type=int, default=None, help="涨停回溯天数 (默认从config读取)")
     parser.add_argument("--config", default=None, help="配置文件路径")
     parser.add_argument("--top", type=int, default=None, help="只输出TOP N")
+    parser.add_argument("--strategies", default=None, help="多策略JSON文件: 加载一次数据, 逐策略输出结果")
+    parser.add_argument("--multi", action="store_true", help="按 config.json 的 strategies 执行多策略扫描")
+    parser.add_argument("--combined", action="store_true", help="多策略结果合并写入 -o 指定的单个文件")
+    parser.add_argument("--stream", action="store_true", help="流式扫描: 按批加载并并行筛选, 内存有界")
     args = parser.parse_args()
 
     config = load_config(args.config)
     if args.days:
         config["scan_lookback_days"] = args.days
+    if args.stream:
+        config["scan_stream"] = True
     provider = DataProvider(args.config)
 
+    if args.strategies or args.multi:
+        strategies = load_strategies(args.strategies, config)
+        if not strategies:
+            print("⚠ 未配置任何策略 (config.json 的 strategies 或 --strategies 文件)")
+            return
+        run_strategies(provider, config, strategies, args.output, args.combined, args.top)
+        return
+
     start = time.time()
     if provider.has_local_data():
-        results = scan_from_local(provider, config)
+        results, stats = scan_from_local(provider, config, args.top)
     else:
-        results = scan_from_api(config)
-
-    if args.top and len(results) > args.top:
-        results = results[: args.top]
+        results, stats = scan_from_api(config, args.top)
 
     output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_data = {
-        "scan_date": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "scan_mode": "local" if provider.has_local_data() else "api",
-        "total_scanned": len(provider.get_all_klines()) if provider.has_local_data() else 0,
-        "result_count": len(results),
-        "results": results,
-    }
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    scan_mode = "local" if provider.has_local_data() else "api"
+    _write_json(output_path, _output_data(
+        results, stats, scan_mode, stats.get("total", 0) if scan_mode == "local" else 0))
 
     elapsed = time.time() - start
     print(f"\n✅ 扫描完成: {len(results)} 只通过筛选, 耗时 {elapsed:.1f}秒")
     print(f"💾 结果保存至 {output_path}")
-
-    if results:
-        print(f"\n🏆 TOP 10:")
-        for i, r in enumerate(results[:10], 1):
-            print(f"  {i:2d}. {r['code']} {r['name']:8s} "
-                  f"¥{r['price']:.2f} ({r['change_pct']:+.2f}%) "
-                  f"评分{r['score']} "
-                  f"涨停{r['limit_up_count']}次 "
-                  f"5日{r['change_5d']:+.1f}%")
+    _print_top(results)
 
 
 if __name__ == "__main__":
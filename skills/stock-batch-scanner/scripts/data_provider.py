@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 """
 本地K线数据抽象层
-支持两种数据源: TDX .day 二进制文件 / JSON缓存文件
-自动按优先级选择: TDX > JSON缓存 > 无数据
+支持三种数据源: TDX .day 二进制文件 / JSON缓存文件 / 列式存储 (kline_store)
+缓存后端由 config.json 的 data_source 选择 ("json_cache" 或 "columnar")
+自动按优先级选择: TDX > 本地缓存 > 无数据
 """
 
 import os
 import json
-import struct
-import glob
+import mmap
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+
+from decoded_cache import DecodedCache
+from indicator_state import STATE_FILE, IndicatorState, sync_stamp
+from symbol_index import SymbolIndex, probe_json, probe_tdx
+from kline_store import (
+    DailyPartitionStore, KlineStore, columns_to_records, format_date, records_to_columns, tail_columns,
+)
+
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 SKILL_DIR = SCRIPT_DIR.parent
@@ -27,47 +38,164 @@ def load_config(config_path=None):
     return {}
 
 
+# 通达信 .day 记录: 日期/开/高/低/收(分) + 成交额(float) + 成交量 + 保留字段, 共32字节
+TDX_DAY_DTYPE = np.dtype([
+    ("date", "<u4"),
+    ("open", "<u4"),
+    ("high", "<u4"),
+    ("low", "<u4"),
+    ("close", "<u4"),
+    ("amount", "<f4"),
+    ("volume", "<u4"),
+    ("reserved", "<u4"),
+])
+
+def decode_tdx_day(buf) -> dict:
+    """
+    将 .day 原始字节整体解码为列式数据。
+    返回: {"date": int32[YYYYMMDD], "open"/"high"/"low"/"close"/"amount": float64,
+           "volume": int64, "change_pct"/"turnover": float64}
+    """
+    usable = len(buf) - len(buf) % TDX_DAY_DTYPE.itemsize
+    raw = np.frombuffer(buf, dtype=TDX_DAY_DTYPE, count=usable // TDX_DAY_DTYPE.itemsize)
+    raw = raw[(raw["date"] >= 10000000) & (raw["date"] <= 99999999)]
+    close = raw["close"] / 100.0
+    return {
+        "date": raw["date"].astype(np.int32),
+        "open": raw["open"] / 100.0,
+        "high": raw["high"] / 100.0,
+        "low": raw["low"] / 100.0,
+        "close": close,
+        "amount": raw["amount"].astype(np.float64),
+        "volume": raw["volume"].astype(np.int64),
+        "change_pct": compute_change_pct(close),
+        "turnover": np.zeros(len(close), dtype=np.float64),
+    }
+
+
+def compute_change_pct(close) -> np.ndarray:
+    """向量化补算涨跌幅(%), 首条记录及前收盘<=0时为0"""
+    pct = np.zeros(len(close), dtype=np.float64)
+    if len(close) > 1:
+        prev = close[:-1]
+        valid = prev > 0
+        pct[1:][valid] = np.round((close[1:][valid] - prev[valid]) / prev[valid] * 100, 2)
+    return pct
+
+
+def read_tdx_columns(filepath, days: int = None) -> dict:
+    """
+    读取 .day 文件并解码为列式数据。
+    指定 days 时按文件大小定位, mmap 只解码末尾 days+1 条记录 (多取1条用于首日涨跌幅),
+    解码开销为 O(days) 而非 O(全部历史)。
+    """
+    record_size = TDX_DAY_DTYPE.itemsize
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        if not days or size < record_size:
+            return decode_tdx_day(f.read())
+        count = size // record_size
+        start = max(count - days - 1, 0) * record_size
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            columns = decode_tdx_day(mm[start : count * record_size])
+    return tail_columns(columns, days)
+
+
 def read_tdx_day(filepath):
     """解析通达信 .day 二进制文件 (32字节/记录)"""
-    records = []
-    with open(filepath, "rb") as f:
-        while True:
-            chunk = f.read(32)
-            if len(chunk) < 32:
-                break
-            date_i, open_i, high_i, low_i, close_i, amount_f, volume_i, _ = struct.unpack(
-                "<IIIIIfII", chunk
-            )
-            date_str = str(date_i)
-            if len(date_str) != 8:
-                continue
-            formatted = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:8]}"
-            records.append({
-                "date": formatted,
-                "open": open_i / 100.0,
-                "high": high_i / 100.0,
-                "low": low_i / 100.0,
-                "close": close_i / 100.0,
-                "amount": amount_f,
-                "volume": volume_i,
-                "change_pct": 0.0,
-                "turnover": 0.0,
-            })
-    _fill_change_pct(records)
-    return records
-
-
-def _fill_change_pct(records):
-    """为TDX数据补算涨跌幅"""
-    for i in range(len(records)):
-        if i == 0:
-            records[i]["change_pct"] = 0.0
-        else:
-            prev_close = records[i - 1]["close"]
-            if prev_close > 0:
-                records[i]["change_pct"] = round(
-                    (records[i]["close"] - prev_close) / prev_close * 100, 2
-                )
+    return columns_to_records(read_tdx_columns(filepath))
+
+
+class Bar(Mapping):
+    """KlineSeries 中单根K线的只读字典视图, 不复制数据"""
+
+    __slots__ = ("_columns", "_i")
+
+    def __init__(self, columns, i):
+        self._columns = columns
+        self._i = i
+
+    def __getitem__(self, key):
+        if key == "date":
+            return format_date(int(self._columns["date"][self._i]))
+        return self._columns[key][self._i].item()
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class KlineSeries(Sequence):
+    """
+    列式K线序列: 各字段为平行的 ndarray, date 为 int32 YYYYMMDD。
+    按下标访问返回 Bar 字典视图、切片返回 KlineSeries, 兼容按 list[dict] 使用K线的既有代码;
+    指标计算可直接取 series.column("close") 等整列数组。
+    """
+
+    __slots__ = ("columns", "_len")
+
+    def __init__(self, columns: dict):
+        self.columns = columns
+        self._len = len(columns["date"])
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return KlineSeries({k: v[i] for k, v in self.columns.items()})
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("KlineSeries index out of range")
+        return Bar(self.columns, i)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def to_records(self) -> list:
+        return columns_to_records(self.columns)
+
+    def __repr__(self):
+        return f"KlineSeries(len={self._len})"
+
+
+def column_of(klines, name: str, default=None) -> list:
+    """取某字段整列 (list), KlineSeries 直接取数组, 普通 list[dict] 逐条取值 (给定 default 时缺失字段取默认值)"""
+    if isinstance(klines, KlineSeries):
+        return klines.column(name).tolist()
+    if default is not None:
+        return [k.get(name, default) for k in klines]
+    return [k[name] for k in klines]
+
+
+def _load_tdx_files(files, days):
+    """进程池工作函数: [(code, path)] → {code: columns}"""
+    result = {}
+    for code, path in files:
+        columns = read_tdx_columns(path, days)
+        if len(columns["date"]):
+            result[code] = columns
+    return result
+
+
+def _load_json_files(files, days):
+    """进程池工作函数: [(code, path)] → {code: columns}, 在子进程内完成JSON解析"""
+    result = {}
+    for code, path in files:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                klines = json.load(fh).get("klines", [])
+        except Exception:
+            continue
+        if klines:
+            result[code] = records_to_columns(klines[-days:] if days and len(klines) > days else klines)
+    return result
 
 
 class DataProvider:
@@ -78,7 +206,26 @@ class DataProvider:
             self.cache_dir = SKILL_DIR / self.cache_dir
         self.klines_dir = self.cache_dir / "klines"
         self.tdx_path = self.config.get("tdx_path", "")
-        self._source = self._detect_source()
+        self.cache_backend = self.config.get("data_source", "json_cache")
+        self.store = KlineStore(self.cache_dir / "columnar")
+        self.partitions = DailyPartitionStore(self.cache_dir / "daily")
+        p = Path(self.tdx_path)
+        self.tdx_index = SymbolIndex(
+            self.cache_dir / "tdx_index.json",
+            [("sh", p / "sh" / "lday", ".day"), ("sz", p / "sz" / "lday", ".day")],
+            probe_tdx,
+        )
+        self.json_index = SymbolIndex(self.cache_dir / "json_index.json", [("", self.klines_dir, ".json")], probe_json)
+        self._detected = False
+        self._source_name = None
+
+    @property
+    def source(self):
+        """数据源在首次使用时才探测, 构造 DataProvider 不扫描目录"""
+        if not self._detected:
+            self._source_name = self._detect_source()
+            self._detected = True
+        return self._source_name
 
     def _detect_source(self):
         min_stocks = self.config.get("min_local_stocks", 5)
@@ -87,24 +234,26 @@ class DataProvider:
             sh_lday = p / "sh" / "lday"
             sz_lday = p / "sz" / "lday"
             if sh_lday.is_dir() or sz_lday.is_dir():
-                day_files = list(sh_lday.glob("*.day")) + list(sz_lday.glob("*.day"))
-                if len(day_files) >= min_stocks:
+                if self.tdx_index.has_at_least(min_stocks):
                     return "tdx"
+        if self.cache_backend == "columnar":
+            return "columnar" if self.store.count() >= min_stocks else None
         if self.klines_dir.is_dir():
-            json_files = list(self.klines_dir.glob("*.json"))
-            if len(json_files) >= min_stocks:
+            if self.json_index.has_at_least(min_stocks):
                 return "json_cache"
         return None
 
     def has_local_data(self) -> bool:
-        return self._source is not None
+        return self.source is not None
 
     def get_source_info(self) -> str:
-        if self._source == "tdx":
+        if self.source == "tdx":
             return f"TDX ({self.tdx_path})"
-        elif self._source == "json_cache":
-            count = len(list(self.klines_dir.glob("*.json")))
+        elif self.source == "json_cache":
+            count = self.json_index.count()
             return f"JSON缓存 ({self.klines_dir}, {count}只)"
+        elif self.source == "columnar":
+            return f"列式存储 ({self.store.root}, {self.store.count()}只)"
         return "无本地数据"
 
     def get_stock_list(self) -> dict:
@@ -113,92 +262,153 @@ class DataProvider:
         if list_file.exists():
             with open(list_file, encoding="utf-8") as f:
                 return json.load(f)
-        if self._source == "tdx":
+        if self.source == "tdx":
             return self._tdx_stock_list()
-        if self._source == "json_cache":
+        if self.source == "json_cache":
             return self._cache_stock_list()
+        if self.source == "columnar":
+            return self.store.names()
         return {}
 
     def get_klines(self, code: str, days: int = 70) -> list:
-        if self._source == "tdx":
+        if self.source == "tdx":
             return self._tdx_get_klines(code, days)
-        elif self._source == "json_cache":
+        elif self.source == "json_cache":
             return self._cache_get_klines(code, days)
+        elif self.source == "columnar":
+            return self.store.get_records(code, days)
         return []
 
     def get_all_klines(self, days: int = 70) -> dict:
         """返回 {code: [kline_records]}"""
         result = {}
-        if self._source == "tdx":
-            result = self._tdx_get_all(days)
-        elif self._source == "json_cache":
-            result = self._cache_get_all(days)
+        if self.source == "tdx":
+            result = {code: columns_to_records(cols) for code, cols in self._tdx_get_all(days).items()}
+        elif self.source == "json_cache":
+            result = {code: columns_to_records(cols) for code, cols in self._cache_get_all_columns(days).items()}
+        elif self.source == "columnar":
+            result = {code: columns_to_records(cols) for code, cols in self.store.get_all_columns(days).items()}
+        return result
+
+    def get_all_series(self, days: int = 70) -> dict:
+        """返回 {code: KlineSeries}, 内存为 list[dict] 的约1/10"""
+        return {code: KlineSeries(cols) for code, cols in self.get_all_columns(days).items()}
+
+    def get_all_columns(self, days: int = 70) -> dict:
+        """返回 {code: {列名: ndarray}}, 全市场加载时避免逐条构造字典"""
+        if self.source == "tdx":
+            return self._tdx_get_all(days)
+        if self.source == "json_cache":
+            return self._cache_get_all_columns(days)
+        if self.source == "columnar":
+            return self.store.get_all_columns(days)
+        return {}
+
+    def iter_series(self, days: int = 70, chunk_size: int = 500):
+        """
+        按 chunk_size 只一批产出 {code: KlineSeries}, 供流式扫描边加载边筛选, 不一次性持有全市场。
+        不读写解码缓存: 缓存的进程内LRU与待写快照会把已产出的批次全部留住, 峰值内存又回到全市场。
+        """
+        if self.source == "columnar":
+            codes = list(self.store.names())
+            for i in range(0, len(codes), chunk_size):
+                yield {c: KlineSeries(self.store.get_columns(c, days)) for c in codes[i : i + chunk_size]}
+            return
+        if self.source == "tdx":
+            loader, index = _load_tdx_files, self.tdx_index
+        elif self.source == "json_cache":
+            loader, index = _load_json_files, self.json_index
+        else:
+            return
+        items = [(code, e) for code, e in index.refresh().items() if self._is_valid_stock_code(code)]
+        for i in range(0, len(items), chunk_size):
+            files = [(code, e["path"]) for code, e in items[i : i + chunk_size]]
+            chunk = self._load_files(loader, files, days)
+            yield {code: KlineSeries(cols) for code, cols in chunk.items()}
+
+    def get_cross_section(self, date_str: str) -> dict:
+        """读取某交易日全市场截面 (来自 daily/ 分区), 无该日返回None"""
+        return self.partitions.read(date_str)
+
+    def get_partition_klines(self, days: int = 70) -> dict:
+        """由最近 days 个日分区拼出 {code: columns} 滚动窗口"""
+        return self.partitions.assemble(days)
+
+    # ---- 并行加载 ----
+
+    def _load_workers(self) -> int:
+        """load_workers: 1=串行 (默认), 0=按CPU核数"""
+        workers = self.config.get("load_workers", 1)
+        return workers if workers > 0 else (os.cpu_count() or 1)
+
+    def _decoded_cache(self, name, days):
+        """每个 (数据源, 加载天数) 一个快照文件, 扫描与回测等不同窗口互不淘汰"""
+        if not self.config.get("decoded_cache", True):
+            return None
+        return DecodedCache(
+            self.cache_dir / "decoded" / f"{name}.{days}.pkl",
+            self.config.get("decoded_cache_size", 20000),
+        )
+
+    def _load_entries(self, loader, entries, days, cache_name):
+        """
+        按索引条目加载全市场: 先查解码缓存 (键为 path/mtime/size/days),
+        只对未命中的文件调用 loader 解码, 结果按原顺序返回。
+        """
+        cache = self._decoded_cache(cache_name, days)
+        keys = {code: (e["path"], e["mtime"], e["size"], days) for code, e in entries.items()}
+        hits = {}
+        misses = []
+        for code, key in keys.items():
+            columns = cache.get(key) if cache else None
+            if columns is not None:
+                hits[code] = columns
+            else:
+                misses.append((code, key[0]))
+        loaded = self._load_files(loader, misses, days) if misses else {}
+        if cache:
+            for code, columns in loaded.items():
+                cache.put(keys[code], columns)
+            cache.save()
+        return {code: hits.get(code, loaded.get(code)) for code in keys if code in hits or code in loaded}
+
+    def _load_files(self, loader, files, days):
+        """按连续分片把文件列表分给进程池, 各进程返回列式数组, 合并后保持原有顺序"""
+        workers = self._load_workers()
+        if workers <= 1 or len(files) < workers * 2:
+            return loader(files, days)
+        chunk = -(-len(files) // (workers * 4))
+        shards = [files[i : i + chunk] for i in range(0, len(files), chunk)]
+        result = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for part in executor.map(loader, shards, [days] * len(shards)):
+                result.update(part)
         return result
 
     # ---- TDX backend ----
 
     def _tdx_stock_list(self):
-        stocks = {}
-        p = Path(self.tdx_path)
-        for market_dir in ["sh/lday", "sz/lday"]:
-            d = p / market_dir
-            if not d.is_dir():
-                continue
-            for f in d.glob("*.day"):
-                code = f.stem.replace("sh", "").replace("sz", "")
-                if self._is_valid_stock_code(code):
-                    stocks[code] = ""
-        return stocks
+        return {code: "" for code in self.tdx_index.refresh() if self._is_valid_stock_code(code)}
 
     def _tdx_get_klines(self, code, days):
         filepath = self._tdx_find_file(code)
         if not filepath:
             return []
-        records = read_tdx_day(filepath)
-        return records[-days:] if days and len(records) > days else records
+        return columns_to_records(read_tdx_columns(filepath, days))
 
     def _tdx_get_all(self, days):
-        result = {}
-        p = Path(self.tdx_path)
-        for prefix, market_dir in [("sz", "sz/lday"), ("sh", "sh/lday")]:
-            d = p / market_dir
-            if not d.is_dir():
-                continue
-            for f in d.glob("*.day"):
-                code = f.stem.replace("sh", "").replace("sz", "")
-                if not self._is_valid_stock_code(code):
-                    continue
-                records = read_tdx_day(str(f))
-                if records:
-                    result[code] = records[-days:] if days and len(records) > days else records
-        return result
+        entries = {code: e for code, e in self.tdx_index.refresh().items() if self._is_valid_stock_code(code)}
+        return self._load_entries(_load_tdx_files, entries, days, "tdx")
 
     def _tdx_find_file(self, code):
-        p = Path(self.tdx_path)
-        exchange = "sh" if code.startswith("6") else "sz"
-        f = p / exchange / "lday" / f"{exchange}{code}.day"
-        if f.exists():
-            return str(f)
-        for market in ["sh/lday", "sz/lday"]:
-            for candidate in (p / market).glob(f"*{code}.day"):
-                return str(candidate)
-        return None
+        entry = self.tdx_index.lookup(code)
+        return entry["path"] if entry else None
 
     # ---- JSON cache backend ----
 
     def _cache_stock_list(self):
-        stocks = {}
-        for f in self.klines_dir.glob("*.json"):
-            code = f.stem
-            if not self._is_valid_stock_code(code):
-                continue
-            try:
-                with open(f, encoding="utf-8") as fh:
-                    data = json.load(fh)
-                stocks[code] = data.get("name", "")
-            except Exception:
-                stocks[code] = ""
-        return stocks
+        entries = self.json_index.refresh()
+        return {code: e.get("name", "") for code, e in entries.items() if self._is_valid_stock_code(code)}
 
     def _cache_get_klines(self, code, days):
         f = self.klines_dir / f"{code}.json"
@@ -212,21 +422,9 @@ class DataProvider:
         except Exception:
             return []
 
-    def _cache_get_all(self, days):
-        result = {}
-        for f in self.klines_dir.glob("*.json"):
-            code = f.stem
-            if not self._is_valid_stock_code(code):
-                continue
-            try:
-                with open(f, encoding="utf-8") as fh:
-                    data = json.load(fh)
-                klines = data.get("klines", [])
-                if klines:
-                    result[code] = klines[-days:] if days and len(klines) > days else klines
-            except Exception:
-                continue
-        return result
+    def _cache_get_all_columns(self, days):
+        entries = {code: e for code, e in self.json_index.refresh().items() if self._is_valid_stock_code(code)}
+        return self._load_entries(_load_json_files, entries, days, "json_cache")
 
     # ---- helpers ----
 
@@ -238,16 +436,33 @@ class DataProvider:
             return True
         return False
 
+    def has_kline(self, code: str) -> bool:
+        if self.cache_backend == "columnar":
+            return self.store.has(code)
+        return (self.klines_dir / f"{code}.json").exists()
+
     def save_kline(self, code: str, name: str, klines: list):
-        """保存单只股票K线到JSON缓存"""
+        """保存单只股票K线到本地缓存 (列式后端需调用 flush() 落盘)"""
+        if self.cache_backend == "columnar":
+            self.store.put(code, name, klines)
+            return
         self.klines_dir.mkdir(parents=True, exist_ok=True)
         f = self.klines_dir / f"{code}.json"
         data = {"code": code, "name": name, "klines": klines}
         with open(f, "w", encoding="utf-8") as fh:
             json.dump(data, fh, ensure_ascii=False)
 
+    def last_dates(self) -> dict:
+        """本地缓存中各股票的最新K线日期 {code: "YYYY-MM-DD"}, 由索引得到, 不解析K线"""
+        if self.cache_backend == "columnar":
+            return self.store.last_dates()
+        return {code: e.get("last_date", "") for code, e in self.json_index.refresh().items()}
+
     def append_daily(self, code: str, daily_record: dict):
         """追加一条日线记录到缓存"""
+        if self.cache_backend == "columnar":
+            self.store.append({code: daily_record})
+            return
         f = self.klines_dir / f"{code}.json"
         if not f.exists():
             return
@@ -265,6 +480,55 @@ class DataProvider:
         except Exception:
             pass
 
+    def append_daily_batch(self, dailies: dict, names: dict):
+        """
+        批量追加当日记录 {code: daily_record}。
+        列式后端: 一次顺序写入 tail.bin, 累计 compact_days 个交易日后自动合并回主段;
+        JSON后端: 逐只追加, 新股票建立新缓存文件。
+        """
+        if self.cache_backend == "columnar":
+            self.store.append(dailies)
+            if self.store.tail_days() >= self.config.get("compact_days", 20):
+                self.store.compact(self.config.get("klines_days", 70) + 30, names)
+            return
+        for code, daily in dailies.items():
+            if self.has_kline(code):
+                self.append_daily(code, daily)
+            else:
+                self.save_kline(code, names.get(code, ""), [daily])
+
+    def save_daily_partition(self, date_str: str, dailies: dict):
+        """将当日全市场截面整体写入一个分区文件"""
+        self.partitions.write(date_str, dailies)
+
+    def flush(self):
+        """将列式后端暂存的写入落盘 (JSON后端为空操作)"""
+        if self.cache_backend == "columnar":
+            self.store.flush(max_keep=self.config.get("klines_days", 70) + 30)
+
+    def checkpoint(self):
+        """将列式后端暂存的写入落盘为分段, 不重写主段 (JSON后端为空操作); 结束时仍需 flush()"""
+        if self.cache_backend == "columnar":
+            self.store.stage()
+
+    def migrate_to_columnar(self) -> int:
+        """将 JSON 缓存整体迁移到列式存储, 返回迁移股票数"""
+        data = {}
+        for f in sorted(self.klines_dir.glob("*.json")):
+            code = f.stem
+            if not self._is_valid_stock_code(code):
+                continue
+            try:
+                with open(f, encoding="utf-8") as fh:
+                    cached = json.load(fh)
+            except Exception:
+                continue
+            klines = cached.get("klines", [])
+            if klines:
+                data[code] = (cached.get("name", ""), records_to_columns(klines))
+        self.store.write(data)
+        return len(data)
+
     def save_stock_list(self, stock_dict: dict):
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         with open(self.cache_dir / "stock_list.json", "w", encoding="utf-8") as f:
@@ -287,6 +551,18 @@ class DataProvider:
                 return json.load(f)
         return {}
 
+    def sync_stamp(self) -> str:
+        return sync_stamp(self.get_sync_meta())
+
+    def indicator_state(self):
+        """
+        增量指标状态, 仅用于本地缓存数据源 (TDX 数据由通达信客户端更新, 不经过 update_daily);
+        config.json 中 indicator_state 为 false 时关闭。
+        """
+        if not self.config.get("indicator_state", True) or self.source == "tdx":
+            return None
+        return IndicatorState(self.cache_dir / STATE_FILE)
+
 
 if __name__ == "__main__":
     provider = DataProvider()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+解码结果缓存
+以 (path, mtime, size, days) 为键缓存解码后的列式K线:
+- 进程内 LRU, 同一进程多次加载直接命中
+- 磁盘快照 (pickle), 文件未变化时跨进程复用, 同一交易日内重复扫描无需重新解码
+"""
+
+import os
+import pickle
+from collections import OrderedDict
+from pathlib import Path
+
+
+# 进程内共享, 同一进程中的多个 DataProvider 实例共用
+_MEMORY = OrderedDict()
+
+
+class DecodedCache:
+    def __init__(self, snapshot_file, max_items: int = 20000):
+        self.snapshot_file = Path(snapshot_file)
+        self.max_items = max_items
+        self._snapshot = None
+        self._used = {}
+
+    def _load_snapshot(self) -> dict:
+        if self._snapshot is None:
+            self._snapshot = {}
+            if self.snapshot_file.exists():
+                try:
+                    with open(self.snapshot_file, "rb") as f:
+                        self._snapshot = pickle.load(f)
+                except Exception:
+                    self._snapshot = {}
+        return self._snapshot
+
+    def get(self, key):
+        value = _MEMORY.get(key)
+        if value is not None:
+            _MEMORY.move_to_end(key)
+        else:
+            value = self._load_snapshot().get(key)
+            if value is not None:
+                self._remember(key, value)
+        if value is not None:
+            self._used[key] = value
+        return value
+
+    def put(self, key, value):
+        for arr in value.values():
+            arr.setflags(write=False)
+        self._remember(key, value)
+        self._used[key] = value
+
+    def _remember(self, key, value):
+        _MEMORY[key] = value
+        _MEMORY.move_to_end(key)
+        while len(_MEMORY) > self.max_items:
+            _MEMORY.popitem(last=False)
+
+    def save(self):
+        """只保留本次加载用到的条目写回快照, 旧版本文件的条目自然淘汰"""
+        if self._used.keys() == self._load_snapshot().keys():
+            return
+        self.snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.snapshot_file.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(self._used, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.snapshot_file)
+        self._snapshot = self._used
+        self._used = {}
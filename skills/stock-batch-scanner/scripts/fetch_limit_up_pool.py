@@ -68,10 +68,11 @@ def fetch_zt_pool_eastmoney(date_str):
 
 def fetch_limit_up_via_kline(codes, days=40, delay=0.3, threads=5):
     """
-    通过K线API判断候选股中哪些近N日有涨停。
+    通过K线API判断候选股中哪些近N日有涨停 (按板块涨停价判定, 见 limit_price)。
     codes: 待查的股票代码列表
     """
     from _import_helper import fetch_kline_eastmoney
+    from limit_price import limit_ratio, limit_up_mask
     from concurrent.futures import ThreadPoolExecutor, as_completed
 
     pool = {}
@@ -91,11 +92,13 @@ def fetch_limit_up_via_kline(codes, days=40, delay=0.3, threads=5):
             try:
                 code, result = future.result()
                 if result and "klines" in result and result["klines"]:
-                    zt_dates = []
-                    for k in result["klines"]:
-                        pct = k.get("change_pct", 0)
-                        if pct >= 9.8:
-                            zt_dates.append(k["date"])
+                    klines = result["klines"]
+                    hits = limit_up_mask(
+                        [k["close"] for k in klines],
+                        [k.get("change_pct", 0) for k in klines],
+                        limit_ratio(code, result.get("name", "")),
+                    )
+                    zt_dates = [k["date"] for k, hit in zip(klines, hits) if hit]
                     if zt_dates:
                         pool[code] = {
                             "name": result.get("name", ""),
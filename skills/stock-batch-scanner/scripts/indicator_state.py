@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+增量指标状态
+按股票持久化扫描所需的滚动状态 (data/indicator_state.npz):
+- 最近 bars 根K线的右对齐窗口 (日期/开/收/低/涨幅/换手), 与全量加载的 MarketFrame 同形状
+- 各 MA 周期的滚动和、最近 MA20_HISTORY 个 MA20 值
+- 窗口内逐日涨停标记
+sync_klines.update_daily 每追加一个交易日, 对每只股票做常数次更新 (窗口左移一格, 滚动和加新减旧),
+扫描时直接由状态表构造 MarketFrame, 不再加载与重算全部K线。
+
+状态以同步元数据 (last_sync.json) 的时间戳标记新鲜度: 全量下载、迁移或漏掉一次增量更新后
+时间戳不一致, 扫描退回完整加载并重建状态。
+"""
+
+import io
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+
+from indicators import MA_PERIODS
+from kline_store import parse_date
+from limit_price import limit_ratios, limit_up_mask
+
+
+STATE_FILE = "indicator_state.npz"
+MA20_HISTORY = 6
+
+
+def sync_stamp(meta: dict) -> str:
+    """影响本地K线内容的同步操作时间戳"""
+    return "|".join(meta.get(k, "") for k in ("last_full_sync", "last_update", "last_migrate"))
+
+
+class IndicatorState:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.codes = []
+        self.mats = {}
+        self.lengths = np.zeros(0, dtype=np.int64)
+        self.sums = {}
+        self.ma20 = np.zeros((0, MA20_HISTORY))
+        self.limit = np.zeros((0, 0), dtype=bool)
+        self.stamp = ""
+
+    @property
+    def bars(self) -> int:
+        return self.limit.shape[1]
+
+    def __len__(self):
+        return len(self.codes)
+
+    # ---------- 构建 / 读写 ----------
+
+    def build(self, frame, stamp: str):
+        """由完整加载的 MarketFrame 建立状态 (复用 frame 已缓存的均线与涨停矩阵)"""
+        self.codes = list(frame.codes)
+        self.mats = {name: mat.copy() for name, mat in frame.mats.items()}
+        self.lengths = frame.lengths.copy()
+        close = np.nan_to_num(frame.mats["close"])
+        self.sums = {p: close[:, -p:].sum(axis=1) for p in MA_PERIODS}
+        self.ma20 = np.column_stack([frame.ma_back(20, k) for k in range(MA20_HISTORY - 1, -1, -1)])
+        self.limit = frame.limit_up().copy()
+        self.stamp = stamp
+
+    def load(self, stamp: str, bars: int) -> bool:
+        """读取状态; 文件不存在、时间戳或窗口长度不一致时返回 False"""
+        if not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("stamp") != stamp or meta.get("bars") != bars:
+                    return False
+                self.codes = data["codes"].tolist()
+                self.mats = {name: data[f"mat_{name}"] for name in meta["fields"]}
+                self.lengths = data["lengths"]
+                self.sums = {p: data[f"sum_{p}"] for p in MA_PERIODS}
+                self.ma20 = data["ma20"]
+                self.limit = data["limit"]
+                self.stamp = stamp
+            return True
+        except Exception:
+            return False
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {"stamp": self.stamp, "bars": self.bars, "fields": list(self.mats)}
+        arrays = {f"mat_{name}": mat for name, mat in self.mats.items()}
+        arrays.update({f"sum_{p}": s for p, s in self.sums.items()})
+        buf = io.BytesIO()
+        np.savez(
+            buf, meta=np.array(json.dumps(meta)), codes=np.array(self.codes),
+            lengths=self.lengths, ma20=self.ma20, limit=self.limit, **arrays,
+        )
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp, self.path)
+
+    # ---------- 增量更新 ----------
+
+    def _add_codes(self, codes: list):
+        n = len(codes)
+        self.codes.extend(codes)
+        for name, mat in self.mats.items():
+            pad = np.zeros((n, self.bars), dtype=mat.dtype) if name == "date" else np.full((n, self.bars), np.nan)
+            self.mats[name] = np.vstack([mat, pad])
+        self.lengths = np.concatenate([self.lengths, np.zeros(n, dtype=self.lengths.dtype)])
+        self.sums = {p: np.concatenate([s, np.zeros(n)]) for p, s in self.sums.items()}
+        self.ma20 = np.vstack([self.ma20, np.full((n, MA20_HISTORY), np.nan)])
+        self.limit = np.vstack([self.limit, np.zeros((n, self.bars), dtype=bool)])
+
+    def update(self, dailies: dict, names: dict, stamp: str) -> int:
+        """
+        追加一个交易日 {code: daily_record}: 每只股票窗口左移一格, 滚动和加新减旧,
+        MA20 历史与涨停标记各追加一项。日期不晚于已有最新日期的记录跳过。返回更新股票数。
+        """
+        index = {c: i for i, c in enumerate(self.codes)}
+        new_codes = [c for c in dailies if c not in index]
+        if new_codes:
+            self._add_codes(new_codes)
+            index.update({c: len(index) + i for i, c in enumerate(new_codes)})
+
+        codes = [c for c in dailies if parse_date(dailies[c]["date"]) > self.mats["date"][index[c], -1]]
+        self.stamp = stamp
+        if not codes:
+            return 0
+        rows = np.array([index[c] for c in codes])
+        new = {
+            name: np.array([parse_date(dailies[c]["date"]) if name == "date" else dailies[c].get(name) or 0
+                            for c in codes], dtype=self.mats[name].dtype)
+            for name in self.mats
+        }
+
+        prev_close = self.mats["close"][rows, -1]
+        for p, s in self.sums.items():
+            # 周期长于窗口时窗口内全部K线都计入, 无需减旧
+            s[rows] += new["close"] - (np.nan_to_num(self.mats["close"][rows, -p]) if p <= self.bars else 0)
+        hit = limit_up_mask(
+            np.column_stack([prev_close, new["close"]]),
+            np.column_stack([np.zeros(len(rows)), new["change_pct"]]),
+            limit_ratios(codes, names),
+        )[:, 1]
+
+        for name, mat in self.mats.items():
+            mat[rows, :-1] = mat[rows, 1:]
+            mat[rows, -1] = new[name]
+        self.limit[rows, :-1] = self.limit[rows, 1:]
+        self.limit[rows, -1] = hit
+        self.lengths[rows] = np.minimum(self.lengths[rows] + 1, self.bars)
+        self.ma20[rows, :-1] = self.ma20[rows, 1:]
+        self.ma20[rows, -1] = np.where(self.lengths[rows] >= 20, self.sums[20][rows] / 20, np.nan)
+        return len(rows)
+
+    def ma_now(self, period: int) -> np.ndarray:
+        """各股最新 MA (由滚动和得到, K线不足时为NaN)"""
+        with np.errstate(invalid="ignore"):
+            return np.where(self.lengths >= period, self.sums[period] / period, np.nan)
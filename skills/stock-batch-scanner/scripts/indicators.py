@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+均线指标计算
+基于累加和 (cumsum) 一次遍历得到任意周期的滑动均值, O(n) 而非 O(n·period)。
+提供单只股票 (1-D) 与全市场矩阵 (stocks × bars, 2-D) 两种形式。
+"""
+
+import numpy as np
+
+
+MA_PERIODS = (5, 10, 20, 60)
+
+
+def _prefix_sum(values) -> np.ndarray:
+    arr = np.asarray(values, dtype=np.float64)
+    cs = np.empty(len(arr) + 1, dtype=np.float64)
+    cs[0] = 0.0
+    np.cumsum(arr, out=cs[1:])
+    return cs
+
+
+def rolling_mean(values, period: int) -> np.ndarray:
+    """滑动均值序列, 长度 len(values) - period + 1, 数据不足返回空数组"""
+    if len(values) < period:
+        return np.zeros(0, dtype=np.float64)
+    cs = _prefix_sum(values)
+    return (cs[period:] - cs[:-period]) / period
+
+
+def ma_table(values, periods=MA_PERIODS) -> dict:
+    """共用一次累加和计算多个周期的均值序列: {period: ndarray}, 数据不足的周期为空数组"""
+    cs = _prefix_sum(values)
+    n = len(cs) - 1
+    return {
+        p: (cs[p:] - cs[:-p]) / p if n >= p else np.zeros(0, dtype=np.float64)
+        for p in periods
+    }
+
+
+def latest_mas(values, periods=MA_PERIODS) -> dict:
+    """各周期最新均值 {period: float或None}"""
+    return {p: float(s[-1]) if len(s) else None for p, s in ma_table(values, periods).items()}
+
+
+# ============================================================
+# 全市场矩阵形式: 行=股票, 列=交易日 (右对齐, 左侧不足部分为NaN)
+# ============================================================
+
+def prefix_sum_2d(matrix: np.ndarray) -> tuple:
+    """按行累加和及有效值计数, 首列补0"""
+    stocks, bars = matrix.shape
+    valid = ~np.isnan(matrix)
+    cs = np.zeros((stocks, bars + 1), dtype=np.float64)
+    np.cumsum(np.where(valid, matrix, 0.0), axis=1, out=cs[:, 1:])
+    cnt = np.zeros((stocks, bars + 1), dtype=np.int32)
+    np.cumsum(valid, axis=1, out=cnt[:, 1:])
+    return cs, cnt
+
+
+def window_mean_2d(cs, cnt, period: int) -> np.ndarray:
+    if cs.shape[1] - 1 < period:
+        return np.full((cs.shape[0], 0), np.nan)
+    out = (cs[:, period:] - cs[:, :-period]) / period
+    out[(cnt[:, period:] - cnt[:, :-period]) < period] = np.nan
+    return out
+
+
+def rolling_mean_2d(matrix: np.ndarray, period: int) -> np.ndarray:
+    """
+    按行计算滑动均值, 返回形状 (stocks, bars - period + 1)。
+    窗口内含NaN (历史不足) 的位置结果为NaN。
+    """
+    return window_mean_2d(*prefix_sum_2d(matrix), period)
+
+
+def ma_table_2d(matrix: np.ndarray, periods=MA_PERIODS) -> dict:
+    """共用一次按行累加和: {period: (stocks, bars - period + 1) 均值矩阵}"""
+    cs, cnt = prefix_sum_2d(matrix)
+    return {p: window_mean_2d(cs, cnt, p) for p in periods}
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+列式K线存储
+全部股票的K线按列存放在一个目录中: 每个字段一个定长 .npy 数组 (可mmap) + index.json
+index.json 记录 code → 起始偏移/条数/名称, 同一股票的K线在各列中连续存放。
+全市场加载只需一次mmap打开, 不再逐个 open + json.load。
+
+每日增量追加到 tail.bin (定长记录, 只追加), 读取时与主段合并,
+累计一定交易日后 compact() 折叠回主段。
+全量下载时 stage() 把暂存的整只股票K线写为 staging/ 下的分段 (不重写主段), 读取时分段整体替代
+该股票在主段中的数据, compact() 时一并折叠, 全量下载只需在结束时重写一次主段。
+index.json 同时记录已折叠的最大分段序号, 切换后残留未删的旧分段不会再覆盖新一代。
+
+重写按代 (generation) 进行: 新一代的各列写为 {字段}.{代}.npy, 并配一个空的 tail.{代}.bin,
+全部写好后以一次 os.replace 切换 index.json, 之后才删除旧代文件。任何时刻中断,
+index.json 指向的要么是完整的旧代 (含其 tail), 要么是完整的新代, 不会出现新旧列混用或 tail 重复回放。
+旧格式 (index.json 只有代码表, 列为 {字段}.npy, 追加段为 tail.bin) 按第0代读取。
+
+DailyPartitionStore 另按交易日保存全市场截面 (daily/YYYY-MM-DD.npy),
+截面查询一次读取, 也可由最近N个分区拼出滚动窗口。
+"""
+
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+# 字段 → 定长类型, date 为 int32 YYYYMMDD
+STORE_FIELDS = {
+    "date": np.int32,
+    "open": np.float64,
+    "close": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "volume": np.int64,
+    "amount": np.float64,
+    "amplitude": np.float64,
+    "change_pct": np.float64,
+    "change": np.float64,
+    "turnover": np.float64,
+}
+
+
+# tail.bin 定长记录: 数字化股票代码 + 全部字段
+TAIL_DTYPE = np.dtype([("code", "<i4")] + [(name, dtype) for name, dtype in STORE_FIELDS.items()])
+
+
+def format_date(date_i: int) -> str:
+    s = str(date_i)
+    return f"{s[:4]}-{s[4:6]}-{s[6:8]}"
+
+
+def parse_date(date_str: str) -> int:
+    return int(date_str.replace("-", ""))
+
+
+def records_to_columns(records: list, fields=None) -> dict:
+    """[kline_record] → 列式数据, 缺失字段补0"""
+    fields = fields or STORE_FIELDS
+    columns = {"date": np.array([parse_date(r["date"]) for r in records], dtype=np.int32)}
+    for name in fields:
+        if name != "date":
+            columns[name] = np.array([r.get(name, 0) or 0 for r in records], dtype=STORE_FIELDS[name])
+    return columns
+
+
+def columns_to_records(columns: dict) -> list:
+    """列式数据 → [kline_record], 兼容既有按字典访问的调用方"""
+    names = [k for k in columns if k != "date"]
+    dates = [format_date(d) for d in columns["date"].tolist()]
+    values = [columns[k].tolist() for k in names]
+    return [dict(zip(names, row), date=d) for d, *row in zip(dates, *values)]
+
+
+def dailies_to_rows(dailies: dict) -> np.ndarray:
+    """{code: kline_record} → TAIL_DTYPE 定长记录数组"""
+    codes = list(dailies)
+    columns = records_to_columns([dailies[c] for c in codes])
+    rows = np.zeros(len(codes), dtype=TAIL_DTYPE)
+    rows["code"] = [int(c) for c in codes]
+    for name in STORE_FIELDS:
+        rows[name] = columns[name]
+    return rows
+
+
+def group_rows(rows: np.ndarray) -> tuple:
+    """按 (code, date) 排序, 返回 (排序后记录, {code: (起始行, 条数)})"""
+    rows = rows[np.lexsort((rows["date"], rows["code"]))]
+    codes, starts, counts = np.unique(rows["code"], return_index=True, return_counts=True)
+    index = {f"{c:06d}": (int(s), int(n)) for c, s, n in zip(codes.tolist(), starts, counts)}
+    return rows, index
+
+
+def tail_columns(columns: dict, days: int) -> dict:
+    if not days or len(columns["date"]) <= days:
+        return columns
+    return {k: v[-days:] for k, v in columns.items()}
+
+
+class KlineStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.index_file = self.root / "index.json"
+        self.tail_file = self.root / "tail.bin"
+        self.generation = 0
+        self.staged_upto = -1
+        self._index = None
+        self._columns = None
+        self._tail = None
+        self._tail_index = None
+        self._appended = []
+        self._appended_last = {}
+        self._staged = {}
+        self._pending = {}
+        self.staging_dir = self.root / "staging"
+
+    def exists(self) -> bool:
+        return self.index_file.exists() or self.tail_file.exists() or bool(self._staged_files())
+
+    def _column_file(self, name: str, generation: int) -> Path:
+        return self.root / (f"{name}.{generation}.npy" if generation else f"{name}.npy")
+
+    def _tail_name(self, generation: int) -> str:
+        return f"tail.{generation}.bin" if generation else "tail.bin"
+
+    def _load(self):
+        self._load_base()
+        self._merge_appended()
+
+    def _load_base(self):
+        """打开主段与 tail (已在内存中的不重复读取), 不合并本进程新追加的记录"""
+        if self._index is not None:
+            return
+        self._index, self._columns = {}, {}
+        self.generation = 0
+        self.staged_upto = -1
+        self.tail_file = self.root / "tail.bin"
+        if self.index_file.exists():
+            with open(self.index_file, encoding="utf-8") as f:
+                meta = json.load(f)
+            if "codes" in meta:
+                self.generation = meta["generation"]
+                self.staged_upto = meta.get("staged", -1)
+                self.tail_file = self.root / meta["tail"]
+                self._index = meta["codes"]
+            else:
+                self._index = meta
+            self._columns = {
+                name: np.load(self._column_file(name, self.generation), mmap_mode="r") for name in STORE_FIELDS
+            }
+        self._load_tail()
+        self._staged = {}
+        for f in self._staged_files():
+            with open(f, encoding="utf-8") as fh:
+                names = json.load(fh)
+            self._add_staged(np.load(f.with_suffix(".npy")), names)
+
+    def _staged_files(self) -> list:
+        """
+        已完整写入且尚未折叠的分段: 记录数组先落盘, 名称表 .json 最后写入作为该分段的完成标记;
+        序号不大于 index.json 中 staged 的已并入主段
+        """
+        if not self.staging_dir.is_dir():
+            return []
+        return sorted(f for f in self.staging_dir.glob("*.json") if int(f.stem) > self.staged_upto)
+
+    def _add_staged(self, rows: np.ndarray, names: dict):
+        """分段中的股票整体替代此前的数据, 后写的分段优先"""
+        rows, index = group_rows(rows)
+        for code, (start, length) in index.items():
+            part = rows[start : start + length]
+            self._staged[code] = (names.get(code, ""), {name: part[name] for name in STORE_FIELDS})
+
+    def _load_tail(self):
+        """读取 tail.bin 并按 (code, date) 排序分组; 截断的半条记录忽略"""
+        tail = np.zeros(0, dtype=TAIL_DTYPE)
+        if self.tail_file.exists():
+            count = self.tail_file.stat().st_size // TAIL_DTYPE.itemsize
+            tail = np.fromfile(self.tail_file, dtype=TAIL_DTYPE, count=count)
+        self._tail, self._tail_index = group_rows(tail)
+        self._appended = []
+        self._appended_last = {}
+
+    def _merge_appended(self):
+        """本进程追加的记录在首次读取时才并入已排序的 tail, 连续多次 append 不重复排序"""
+        if self._appended:
+            self._tail, self._tail_index = group_rows(np.concatenate([self._tail] + self._appended))
+            self._appended = []
+
+    def _release(self):
+        self._index = None
+        self._columns = None
+        self._tail = None
+        self._tail_index = None
+
+    def _codes(self) -> list:
+        codes = list(self._index)
+        seen = set(codes)
+        for code in list(self._tail_index) + list(self._staged):
+            if code not in seen:
+                seen.add(code)
+                codes.append(code)
+        return codes
+
+    def _last_date(self, code: str) -> int:
+        if code in self._appended_last:
+            return self._appended_last[code]
+        last = 0
+        if code in self._tail_index:
+            start, length = self._tail_index[code]
+            last = int(self._tail["date"][start + length - 1])
+        staged = self._staged.get(code)
+        if staged:
+            dates = staged[1]["date"]
+            return max(last, int(dates[-1])) if len(dates) else last
+        if last:
+            return last
+        entry = self._index.get(code)
+        if entry:
+            return int(self._columns["date"][entry["offset"] + entry["length"] - 1])
+        return 0
+
+    # ---- 读取 ----
+
+    def count(self) -> int:
+        self._load()
+        return len(self._codes())
+
+    def has(self, code: str) -> bool:
+        self._load()
+        return code in self._index or code in self._tail_index or code in self._staged or code in self._pending
+
+    def last_dates(self) -> dict:
+        """{code: 最新K线日期 YYYY-MM-DD} (含 tail.bin 中的追加)"""
+        self._load()
+        return {code: format_date(self._last_date(code)) for code in self._codes()}
+
+    def tail_days(self) -> int:
+        """tail.bin 中累计的交易日数"""
+        self._load()
+        return len(np.unique(self._tail["date"]))
+
+    def name(self, code: str) -> str:
+        self._load()
+        if code in self._staged:
+            return self._staged[code][0]
+        entry = self._index.get(code)
+        return entry["name"] if entry else ""
+
+    def names(self) -> dict:
+        self._load()
+        return {code: self.name(code) for code in self._codes()}
+
+    def get_columns(self, code: str, days: int = None) -> dict:
+        self._load()
+        entry = self._index.get(code)
+        tail = self._tail_index.get(code)
+        staged = self._staged.get(code)
+        if not entry and not tail and not staged:
+            return None
+        base = None
+        if staged:
+            base = tail_columns(staged[1], days)
+        elif entry:
+            start, length = entry["offset"], entry["length"]
+            if days and length > days:
+                start, length = start + length - days, days
+            base = {name: col[start : start + length] for name, col in self._columns.items()}
+        if not tail:
+            return base
+        start, length = tail
+        rows = self._tail[start : start + length]
+        if staged and len(base["date"]):
+            # 分段写入前追加的记录已包含在分段中
+            rows = rows[rows["date"] > base["date"][-1]]
+        if base is None:
+            return tail_columns({name: rows[name] for name in STORE_FIELDS}, days)
+        merged = {name: np.concatenate([base[name], rows[name]]) for name in STORE_FIELDS}
+        return tail_columns(merged, days)
+
+    def get_records(self, code: str, days: int = None) -> list:
+        columns = self.get_columns(code, days)
+        return columns_to_records(columns) if columns else []
+
+    def get_all_columns(self, days: int = None) -> dict:
+        self._load()
+        return {code: self.get_columns(code, days) for code in self._codes()}
+
+    # ---- 写入 ----
+
+    def put(self, code: str, name: str, klines: list):
+        """暂存单只股票的完整K线, flush() 时统一落盘"""
+        self._pending[code] = (name, klines)
+
+    def stage(self):
+        """将暂存写入落盘为 staging/ 下的一个分段, 不重写主段; 返回后这些股票的数据即已持久化"""
+        if not self._pending:
+            return
+        parts = []
+        names = {}
+        for code, (name, klines) in self._pending.items():
+            columns = records_to_columns(klines)
+            rows = np.zeros(len(columns["date"]), dtype=TAIL_DTYPE)
+            rows["code"] = int(code)
+            for field in STORE_FIELDS:
+                rows[field] = columns[field]
+            parts.append(rows)
+            names[code] = name
+        rows = np.concatenate(parts)
+        self._load_base()
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        files = self._staged_files()
+        seq = int(files[-1].stem) + 1 if files else self.staged_upto + 1
+        path = self.staging_dir / f"{seq:06d}.npy"
+        _write_synced(path, lambda f: np.save(f, rows))
+        _write_synced(path.with_suffix(".json"),
+                      lambda f: f.write(json.dumps(names, ensure_ascii=False).encode("utf-8")))
+        self._add_staged(rows, names)
+        self._pending = {}
+
+    def append(self, dailies: dict) -> int:
+        """
+        追加每日记录 {code: kline_record} 到 tail.bin, 一次顺序写入。
+        日期不晚于已存最新日期的记录跳过, 返回实际追加条数。
+        """
+        self._load_base()
+        codes = [c for c, rec in dailies.items() if parse_date(rec["date"]) > self._last_date(c)]
+        if not codes:
+            return 0
+        rows = dailies_to_rows({c: dailies[c] for c in codes})
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.tail_file, "ab") as f:
+            f.write(rows.tobytes())
+        # 就地记下新记录, 不丢弃已打开的主段与已排序的 tail
+        self._appended.append(rows)
+        self._appended_last.update(zip(codes, rows["date"].tolist()))
+        return len(codes)
+
+    def flush(self, max_keep: int = None):
+        if not self._pending and not self._staged_files():
+            return
+        self.compact(max_keep)
+
+    def compact(self, max_keep: int = None, names: dict = None):
+        """主段 + tail.bin + staging/ 分段 + 暂存写入 合并重写为新主段, 并清空 tail.bin 与分段"""
+        self._load()
+        names = names or {}
+        data = {}
+        for code in self._codes():
+            if code not in self._pending:
+                columns = self.get_columns(code)
+                name = self.name(code) or names.get(code, "")
+                data[code] = (name, {k: np.array(v) for k, v in columns.items()})
+        for code, (name, klines) in self._pending.items():
+            data[code] = (name, records_to_columns(klines))
+        self._pending = {}
+        self.write(data, max_keep)
+
+    def write(self, data: dict, max_keep: int = None):
+        """整体重写为新的一代。data: {code: (name, columns)}"""
+        self._load()
+        generation = self.generation + 1
+        files = self._staged_files()
+        staged_upto = int(files[-1].stem) if files else self.staged_upto
+        self._release()
+        self.root.mkdir(parents=True, exist_ok=True)
+        index = {}
+        parts = {name: [] for name in STORE_FIELDS}
+        offset = 0
+        for code in sorted(data):
+            name, columns = data[code]
+            columns = tail_columns(columns, max_keep)
+            length = len(columns["date"])
+            if not length:
+                continue
+            for field, dtype in STORE_FIELDS.items():
+                col = columns.get(field)
+                parts[field].append(
+                    np.zeros(length, dtype=dtype) if col is None else np.asarray(col, dtype=dtype)
+                )
+            index[code] = {"offset": offset, "length": length, "name": name}
+            offset += length
+
+        for field, dtype in STORE_FIELDS.items():
+            arr = np.concatenate(parts[field]) if parts[field] else np.zeros(0, dtype=dtype)
+            _write_synced(self._column_file(field, generation), lambda f: np.save(f, arr))
+        tail = self._tail_name(generation)
+        _write_synced(self.root / tail, lambda f: None)
+        meta = {"generation": generation, "tail": tail, "staged": staged_upto, "codes": index}
+        tmp = self.root / "index.tmp.json"
+        _write_synced(tmp, lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8")))
+        # 唯一的提交点
+        os.replace(tmp, self.index_file)
+        self._remove_stale(generation)
+
+    def _remove_stale(self, generation: int):
+        """删除不属于当前代的列文件与追加段"""
+        keep = {self._column_file(name, generation).name for name in STORE_FIELDS}
+        keep.add(self._tail_name(generation))
+        stale = [f for f in list(self.root.glob("*.npy")) + list(self.root.glob("tail*.bin")) if f.name not in keep]
+        # 分段已折叠进新一代 (index.json 中的 staged 已覆盖其序号)
+        if self.staging_dir.is_dir():
+            stale += list(self.staging_dir.iterdir())
+        for f in stale:
+            try:
+                f.unlink()
+            except OSError:
+                pass
+        try:
+            self.staging_dir.rmdir()
+        except OSError:
+            pass
+
+
+def _write_synced(path: Path, write):
+    """写入并 fsync, 保证切换 index.json 前新一代文件已完整落盘"""
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class DailyPartitionStore:
+    """按交易日分区的全市场截面, 每个交易日一个 TAIL_DTYPE 记录数组文件"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def dates(self) -> list:
+        if not self.root.is_dir():
+            return []
+        return sorted(f.stem for f in self.root.glob("????-??-??.npy"))
+
+    def write(self, date_str: str, dailies: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f"{date_str}.tmp.npy"
+        np.save(tmp, dailies_to_rows(dailies))
+        os.replace(tmp, self.root / f"{date_str}.npy")
+
+    def read(self, date_str: str) -> dict:
+        """单日截面: {"code": str数组, 字段: ndarray}, 无该分区返回None"""
+        f = self.root / f"{date_str}.npy"
+        if not f.exists():
+            return None
+        rows = np.load(f)
+        columns = {"code": np.char.zfill(rows["code"].astype(str), 6)}
+        columns.update({name: rows[name] for name in STORE_FIELDS})
+        return columns
+
+    def assemble(self, days: int) -> dict:
+        """由最近 days 个分区拼出滚动窗口 {code: columns}"""
+        dates = self.dates()[-days:] if days else self.dates()
+        if not dates:
+            return {}
+        rows, index = group_rows(np.concatenate([np.load(self.root / f"{d}.npy") for d in dates]))
+        return {
+            code: {name: rows[name][start : start + length] for name in STORE_FIELDS}
+            for code, (start, length) in index.items()
+        }
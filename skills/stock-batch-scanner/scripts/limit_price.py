@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+涨跌停价计算 (按板块)
+涨跌幅限制由代码前缀与名称决定:
+- 主板 10%, ST/*ST 5%
+- 创业板 (300/301) 与科创板 (688/689) 20%, 含ST
+- 北交所 (8/4/92 开头) 30%
+涨停价 = 前收盘 × (1 + 限制), 跌停价 = 前收盘 × (1 - 限制), 均按最小价位 0.01 四舍五入。
+逐日判断时, 收盘价达到涨停价, 或涨跌幅达到 限制 × (1 - LIMIT_PCT_SLACK) 即判为涨停 (跌停对称)。
+前复权K线 (东方财富 fqt=1) 在除权日之前的价格经过缩放, 按价位比较会大量漏判 (模拟中10%涨停漏判约17%),
+此时由接口给出的涨跌幅 (按实际价格计算) 兜底; 不复权数据 (TDX) 按价位比较即可精确判断。
+支持单只股票序列 (1-D) 与全市场矩阵 (stocks × bars, 每行一个限制比例)。
+"""
+
+import numpy as np
+
+
+PRICE_TICK = 0.01
+
+LIMIT_MAIN = 0.10
+LIMIT_ST = 0.05
+LIMIT_GROWTH = 0.20
+LIMIT_BSE = 0.30
+
+# 价位比较容差: 半个最小价位, 低于涨停价一个价位的收盘不计入
+LIMIT_TOLERANCE = PRICE_TICK / 2
+
+# 涨跌幅判断的相对余量: 主板 9.8%, ST 4.9%, 创业板/科创板 19.6%, 北交所 29.4%
+LIMIT_PCT_SLACK = 0.02
+
+# 单日涨跌幅超出板块限制再加该余量 (百分点) 时, 只能来自除权除息/新股上市等价格缺口, 不是可实现的涨跌
+BEYOND_LIMIT_MARGIN = 1.0
+
+
+def is_st(name: str) -> bool:
+    return "ST" in str(name or "").upper()
+
+
+def limit_ratio(code: str, name: str = "") -> float:
+    """单只股票的涨跌幅限制比例"""
+    code = str(code)
+    if code.startswith(("8", "4", "92")):
+        return LIMIT_BSE
+    if code.startswith(("300", "301", "688", "689")):
+        return LIMIT_GROWTH
+    if is_st(name):
+        return LIMIT_ST
+    return LIMIT_MAIN
+
+
+def limit_ratios(codes, names: dict = None) -> np.ndarray:
+    """批量计算涨跌幅限制比例, names 为 {code: 名称}"""
+    names = names or {}
+    return np.array([limit_ratio(c, names.get(c, "")) for c in codes], dtype=np.float64)
+
+
+def round_to_tick(prices, tick: float = PRICE_TICK) -> np.ndarray:
+    """按最小价位四舍五入 (加微小偏移抵消 x.xx5 的二进制表示误差)"""
+    return np.floor(np.asarray(prices, dtype=np.float64) / tick + 0.5 + 1e-9) * tick
+
+
+def limit_up_price(prev_close, ratio) -> np.ndarray:
+    return round_to_tick(np.asarray(prev_close, dtype=np.float64) * (1 + np.asarray(ratio, dtype=np.float64)))
+
+
+def limit_down_price(prev_close, ratio) -> np.ndarray:
+    return round_to_tick(np.asarray(prev_close, dtype=np.float64) * (1 - np.asarray(ratio, dtype=np.float64)))
+
+
+def limit_pct(ratio) -> np.ndarray:
+    """按涨跌幅判断涨跌停的阈值 (%), 随板块限制等比缩放"""
+    return np.asarray(ratio, dtype=np.float64) * 100 * (1 - LIMIT_PCT_SLACK)
+
+
+def _prepare(close, change_pct, ratio):
+    """统一为 float 数组; 矩阵输入时 ratio 按行广播; 前收盘取 close 的前一列, 首日为 NaN"""
+    close = np.asarray(close, dtype=np.float64)
+    pct = np.asarray(change_pct, dtype=np.float64)
+    ratio = np.asarray(ratio, dtype=np.float64)
+    if close.ndim == 2 and ratio.ndim == 1:
+        ratio = ratio[:, None]
+    prev = np.full(close.shape, np.nan)
+    prev[..., 1:] = close[..., :-1]
+    return close, pct, ratio, prev
+
+
+def limit_up_mask(close, change_pct, ratio) -> np.ndarray:
+    """
+    逐日是否涨停, 与 close 同形状。
+    close / change_pct 为 1-D 序列或 (stocks × bars) 矩阵, ratio 为标量或每行一个比例;
+    收盘价达到按前收盘算出的涨停价, 或涨幅达到 limit_pct(ratio) 即为涨停。
+    """
+    close, pct, ratio, prev = _prepare(close, change_pct, ratio)
+    with np.errstate(invalid="ignore"):
+        return (close >= limit_up_price(prev, ratio) - LIMIT_TOLERANCE) | (pct >= limit_pct(ratio))
+
+
+def limit_down_mask(close, change_pct, ratio) -> np.ndarray:
+    """逐日是否跌停, 参数与判断方式同 limit_up_mask"""
+    close, pct, ratio, prev = _prepare(close, change_pct, ratio)
+    with np.errstate(invalid="ignore"):
+        return (close <= limit_down_price(prev, ratio) + LIMIT_TOLERANCE) | (pct <= -limit_pct(ratio))
+
+
+def beyond_limit_mask(change_pct, ratio) -> np.ndarray:
+    """
+    逐日涨跌幅绝对值是否超出 限制 + BEYOND_LIMIT_MARGIN, 与 change_pct 同形状, NaN 为 False。
+    不复权K线 (TDX) 上即除权缺口: 跨过这些K线的收益与回撤不是真实盈亏。
+    """
+    pct = np.asarray(change_pct, dtype=np.float64)
+    ratio = np.asarray(ratio, dtype=np.float64)
+    if pct.ndim == 2 and ratio.ndim == 1:
+        ratio = ratio[:, None]
+    with np.errstate(invalid="ignore"):
+        return np.abs(pct) > ratio * 100 + BEYOND_LIMIT_MARGIN
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+筛选规则注册表与编译
+每条规则是 (frame, rows, **params) → rows 上布尔掩码 的向量化函数, 用 @rule 注册,
+并标注相对开销 cost 与预估通过率 selectivity。
+
+config.json 的 "screen" 以声明式列表组合规则:
+    "screen": {
+        "min_bars": 20,
+        "order": "auto",
+        "rules": [
+            {"rule": "limit_up", "lookback": 40},
+            {"rule": "ma_order", "periods": [5, 10, 20, 60], "stage": "multi_head"},
+            ...
+        ]
+    }
+compile_screen() 把规则按 stage 分组 (缺省每条规则自成一组), order 为 auto 时组内、组间均按
+cost / (1 - selectivity) 升序排列, 开销低、过滤强的规则先执行, 尽早缩小候选集。
+"""
+
+import inspect
+
+import numpy as np
+
+
+RULES = {}
+
+
+def rule(name: str, cost: float = 1.0, selectivity: float = 0.5):
+    """注册筛选规则: cost 为相对计算开销, selectivity 为预估通过率"""
+    def register(fn):
+        RULES[name] = {"fn": fn, "cost": cost, "selectivity": selectivity}
+        return fn
+    return register
+
+
+# ============================================================
+# 内置规则
+# ============================================================
+
+@rule("min_bars", cost=0.1, selectivity=0.95)
+def min_bars(frame, rows, bars=20):
+    """K线数量不少于 bars"""
+    return frame.lengths[rows] >= bars
+
+
+@rule("limit_up", cost=1.0, selectivity=0.2)
+def limit_up(frame, rows, lookback=40, threshold=None, min_count=1):
+    """近 lookback 日涨停次数不少于 min_count; 缺省按板块涨停价判定, 给出 threshold 时按涨幅 >= threshold (%)"""
+    return frame.limit_hits(lookback, threshold)[rows].sum(axis=1) >= min_count
+
+
+@rule("ma_order", cost=2.0, selectivity=0.4)
+def ma_order(frame, rows, periods=(5, 10, 20, 60), relax=True):
+    """均线多头排列 MA[0] > MA[1] > ...; relax 时最长周期数据不足则只比较其余均线"""
+    mas = [frame.ma_back(p)[rows] for p in periods]
+    with np.errstate(invalid="ignore"):
+        pairs = [a > b for a, b in zip(mas, mas[1:])]
+        full = np.logical_and.reduce(pairs) if pairs else np.ones(len(rows), dtype=bool)
+        if not relax or len(pairs) < 2:
+            return full
+        return np.where(np.isnan(mas[-1]), np.logical_and.reduce(pairs[:-1]), full)
+
+
+@rule("ma_rising", cost=1.0, selectivity=0.5)
+def ma_rising(frame, rows, period=20, days=5):
+    """当前 MA 高于 days 日前"""
+    with np.errstate(invalid="ignore"):
+        return frame.ma_back(period)[rows] > frame.ma_back(period, days)[rows]
+
+
+@rule("close_above_ma", cost=1.0, selectivity=0.5)
+def close_above_ma(frame, rows, periods=(10, 20)):
+    """最新收盘价不低于各周期均线"""
+    close = frame.last("close")[rows]
+    with np.errstate(invalid="ignore"):
+        return np.logical_and.reduce([close >= frame.ma_back(p)[rows] for p in periods])
+
+
+@rule("touch_ma", cost=2.0, selectivity=0.5)
+def touch_ma(frame, rows, periods=(10, 20), tolerance=0.03, days=5):
+    """近 days 日最低价曾触及任一均线附近 (±tolerance)"""
+    lows = frame.mats["low"][rows, -days:]
+    touched = np.zeros(len(rows), dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for p in periods:
+            ma = frame.ma_back(p)[rows][:, None]
+            touched |= (np.abs(lows - ma) / ma < tolerance).any(axis=1)
+    return touched
+
+
+@rule("bullish_candle", cost=0.5, selectivity=0.5)
+def bullish_candle(frame, rows):
+    """最新K线收盘 > 开盘"""
+    with np.errstate(invalid="ignore"):
+        return frame.last("close")[rows] > frame.last("open")[rows]
+
+
+@rule("period_change", cost=0.5, selectivity=0.5)
+def period_change(frame, rows, days=5, min_pct=None, max_pct=None):
+    """近 days 日涨跌幅 (%) 落在 [min_pct, max_pct]"""
+    now = frame.last("close")[rows]
+    before = frame.mats["close"][rows, -(days + 1)] if frame.mats["close"].shape[1] > days else np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        change = (now / before - 1) * 100
+        passed = ~np.isnan(change)
+        if min_pct is not None:
+            passed &= change >= min_pct
+        if max_pct is not None:
+            passed &= change <= max_pct
+    return passed
+
+
+@rule("price_range", cost=0.2, selectivity=0.8)
+def price_range(frame, rows, min_price=None, max_price=None):
+    """最新收盘价落在 [min_price, max_price]"""
+    close = frame.last("close")[rows]
+    passed = ~np.isnan(close)
+    with np.errstate(invalid="ignore"):
+        if min_price is not None:
+            passed &= close >= min_price
+        if max_price is not None:
+            passed &= close <= max_price
+    return passed
+
+
+# 默认筛选: 三重筛选 (近期涨停 + 多头排列 + 右侧买点)
+DEFAULT_SCREEN = {
+    "min_bars": 20,
+    "order": "auto",
+    "rules": [
+        {"rule": "limit_up"},
+        {"rule": "ma_order", "periods": [5, 10, 20, 60], "stage": "multi_head"},
+        {"rule": "min_bars", "bars": 25, "stage": "right_side"},
+        {"rule": "ma_rising", "period": 20, "days": 5, "stage": "right_side"},
+        {"rule": "close_above_ma", "periods": [10, 20], "stage": "right_side"},
+        {"rule": "touch_ma", "periods": [10, 20], "tolerance": 0.03, "days": 5, "stage": "right_side"},
+        {"rule": "bullish_candle", "stage": "right_side"},
+    ],
+}
+
+
+# ============================================================
+# 编译
+# ============================================================
+
+def _rank(item) -> float:
+    return item["cost"] / max(1.0 - item["selectivity"], 1e-6)
+
+
+def compile_screen(screen: dict = None, lookback: int = 40) -> dict:
+    """
+    声明式筛选 → {"min_bars": int, "stages": [{"stage", "rules", "cost", "selectivity"}]}
+    接受 lookback 参数的规则未显式指定时使用扫描回溯天数。
+    规则名或参数名不在规则函数签名中时抛出 ValueError, 配置错误在加载数据前即可发现。
+    """
+    screen = screen or DEFAULT_SCREEN
+    stages = {}
+    for spec in screen.get("rules", []):
+        params = dict(spec)
+        name = params.pop("rule")
+        if name not in RULES:
+            raise ValueError(f"未知筛选规则: {name} (可用: {', '.join(sorted(RULES))})")
+        meta = RULES[name]
+        stage = params.pop("stage", name)
+        cost = params.pop("cost", meta["cost"])
+        selectivity = params.pop("selectivity", meta["selectivity"])
+        signature = inspect.signature(meta["fn"])
+        accepted = list(signature.parameters)[2:]
+        unknown = sorted(set(params) - set(accepted))
+        if unknown:
+            raise ValueError(f"筛选规则 {name} 不支持参数: {', '.join(unknown)} (可用: {', '.join(accepted) or '无'})")
+        try:
+            signature.bind_partial(None, None, **params)
+        except TypeError as e:
+            raise ValueError(f"筛选规则 {name} 参数错误: {e}") from None
+        if "lookback" in accepted:
+            params.setdefault("lookback", lookback)
+        stages.setdefault(stage, []).append({
+            "rule": name, "fn": meta["fn"], "params": params, "cost": cost, "selectivity": selectivity,
+        })
+
+    auto = screen.get("order", "auto") == "auto"
+    compiled = []
+    for stage, items in stages.items():
+        if auto:
+            items.sort(key=_rank)
+        compiled.append({
+            "stage": stage,
+            "rules": items,
+            "cost": sum(i["cost"] for i in items),
+            "selectivity": float(np.prod([i["selectivity"] for i in items])),
+        })
+    if auto:
+        compiled.sort(key=_rank)
+    return {"min_bars": screen.get("min_bars", 20), "stages": compiled}
+
+
+def evaluate_stage(frame, rows: np.ndarray, stage: dict) -> np.ndarray:
+    """依次执行阶段内各规则, 每条规则只在前一条的幸存行上求值, 返回 rows 上的掩码"""
+    mask = np.ones(len(rows), dtype=bool)
+    for item in stage["rules"]:
+        alive = np.flatnonzero(mask)
+        if not len(alive):
+            break
+        mask[alive] = item["fn"](frame, rows[alive], **item["params"])
+    return mask
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+本地K线文件索引
+持久化 code → 路径/交易所/mtime/大小/记录数/最新日期, 构造 DataProvider 和单股查找时不再重复 glob。
+刷新按 (mtime, size) 增量进行: 只重新探测新增或有变化的文件, 探测只读文件尾/原始字节, 不做完整解析。
+"""
+
+import os
+import re
+import json
+from pathlib import Path
+
+
+TDX_RECORD_SIZE = 32
+
+_JSON_NAME = re.compile(rb'"name":\s*"((?:[^"\\]|\\.)*)"')
+_JSON_DATE = re.compile(rb'"date":\s*"(\d{4}-\d{2}-\d{2})"')
+
+
+def probe_tdx(path: str, size: int) -> dict:
+    """记录数由文件大小得出, 最新日期读最后一条记录的前4字节"""
+    records = size // TDX_RECORD_SIZE
+    last_date = ""
+    if records:
+        with open(path, "rb") as f:
+            f.seek((records - 1) * TDX_RECORD_SIZE)
+            d = str(int.from_bytes(f.read(4), "little"))
+        if len(d) == 8:
+            last_date = f"{d[:4]}-{d[4:6]}-{d[6:8]}"
+    return {"records": records, "last_date": last_date}
+
+
+def probe_json(path: str, size: int) -> dict:
+    """在原始字节上统计记录数、取名称与最新日期, 避免 json.load"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    m = _JSON_NAME.search(raw, 0, 512)
+    dates = _JSON_DATE.findall(raw[-512:])
+    return {
+        "records": raw.count(b'"date"'),
+        "last_date": dates[-1].decode() if dates else "",
+        "name": json.loads(b'"' + m.group(1) + b'"') if m else "",
+    }
+
+
+def code_exchange(code: str) -> str:
+    return "sh" if code.startswith("6") else "sz"
+
+
+class SymbolIndex:
+    """
+    dirs: [(exchange, 目录, 后缀)], exchange 为空表示文件名即代码 (JSON缓存),
+    否则文件名形如 sh600000.day。
+    """
+
+    def __init__(self, index_file, dirs, probe):
+        self.index_file = Path(index_file)
+        self.dirs = [(ex, Path(d), suffix) for ex, d, suffix in dirs]
+        self.probe = probe
+        self._entries = None
+
+    def _roots(self) -> list:
+        return [str(d) for _, d, _ in self.dirs]
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("roots") == self._roots():
+                    self._entries = data.get("entries", {})
+                    return self._entries
+            except Exception:
+                pass
+        return None
+
+    def _save(self):
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"roots": self._roots(), "entries": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.index_file)
+
+    def _iter_files(self):
+        """列目录, 产出 (code, exchange, DirEntry), 不做 stat"""
+        for exchange, d, suffix in self.dirs:
+            if not d.is_dir():
+                continue
+            with os.scandir(d) as it:
+                for e in it:
+                    if not e.name.endswith(suffix):
+                        continue
+                    stem = e.name[: -len(suffix)]
+                    code = stem[len(exchange):] if exchange and stem.startswith(exchange) else stem
+                    yield code, exchange or code_exchange(code), e
+
+    def _scan(self):
+        """列目录, 产出 (code, exchange, path, stat)"""
+        for code, exchange, e in self._iter_files():
+            if e.is_file():
+                yield code, exchange, e.path, e.stat()
+
+    def _make_entry(self, exchange, path, st) -> dict:
+        entry = {"path": path, "exchange": exchange, "mtime": st.st_mtime, "size": st.st_size}
+        entry.update(self.probe(path, st.st_size))
+        return entry
+
+    def entries(self) -> dict:
+        """已持久化的索引; 尚未建立时完整构建一次"""
+        entries = self._load()
+        return entries if entries is not None else self.refresh()
+
+    def refresh(self) -> dict:
+        """列目录并按 (mtime, size) 增量更新索引, 有变化时写回磁盘"""
+        old = self._load() or {}
+        # 同一代码出现在两个交易所目录 (如 sh000001 指数与 sz000001) 时, 以代码所属交易所为准;
+        # 先去重再比较 mtime/size, 否则落选的文件每次都会被重新探测并触发索引重写
+        files = {}
+        for code, exchange, path, st in self._scan():
+            if code not in files or exchange == code_exchange(code):
+                files[code] = (exchange, path, st)
+        entries = {}
+        changed = self._entries is None
+        for code, (exchange, path, st) in files.items():
+            prev = old.get(code)
+            if prev and prev["path"] == path and prev["mtime"] == st.st_mtime and prev["size"] == st.st_size:
+                entries[code] = prev
+            else:
+                entries[code] = self._make_entry(exchange, path, st)
+                changed = True
+        changed = changed or len(entries) != len(old)
+        self._entries = entries
+        if changed:
+            self._save()
+        return entries
+
+    def has_at_least(self, n: int) -> bool:
+        """是否至少有n个文件: 优先读持久化索引, 否则列目录数到n个即停止"""
+        entries = self._load()
+        if entries is not None and len(entries) >= n:
+            return True
+        found = 0
+        for _ in self._iter_files():
+            found += 1
+            if found >= n:
+                return True
+        return n <= 0
+
+    def count(self) -> int:
+        return len(self.entries())
+
+    def lookup(self, code: str) -> dict:
+        """单股查找: 命中索引后只 stat 该文件校验, 未命中或文件已删除时刷新一次"""
+        entries = self.entries()
+        entry = entries.get(code)
+        if entry:
+            try:
+                st = os.stat(entry["path"])
+            except OSError:
+                entry = None
+            else:
+                if st.st_mtime != entry["mtime"] or st.st_size != entry["size"]:
+                    entry = self._make_entry(entry["exchange"], entry["path"], st)
+                    entries[code] = entry
+                    self._save()
+                return entry
+        return self.refresh().get(code)
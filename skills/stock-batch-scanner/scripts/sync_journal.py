@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+全量下载工作日志 (data/sync_journal.jsonl)
+追加写的 JSON Lines, 记录一次 --init 的进度:
+- {"run": 开始时间, "klines_days": N}            一次下载的起点
+- {"code": 代码, "status": "done"|"failed", "date": 最新K线日期, "attempts": 累计失败次数}
+- {"finished": 完成时间}                          没有可重试的股票后写入
+同一代码以最后一行为准。日志行只在对应K线已落盘后写入 (commit 前先 provider.checkpoint()),
+中断后重跑 --init 从日志续传: 本次运行中已完成的股票跳过 (不论K线日期, 跨交易日的部分由增量同步补齐),
+只重试失败与未完成的股票; 连续失败 max_retries 次的股票不再重试, 也不阻止本次运行完成。
+"""
+
+import os
+import json
+from datetime import datetime
+from pathlib import Path
+
+
+JOURNAL_FILE = "sync_journal.jsonl"
+
+
+class SyncJournal:
+    def __init__(self, path, max_retries: int = 3):
+        self.path = Path(path)
+        self.max_retries = max_retries
+        self.run = None
+        self.klines_days = None
+        self.finished = False
+        self.entries = {}
+        self._buffer = []
+
+    def load(self) -> bool:
+        """读取日志; 不存在或无法解析时返回 False。末尾写了一半的行忽略"""
+        if not self.path.exists():
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if "run" in entry:
+                        self.run = entry["run"]
+                        self.klines_days = entry.get("klines_days")
+                        self.finished = False
+                        self.entries = {}
+                    elif "finished" in entry:
+                        self.finished = True
+                    elif "code" in entry:
+                        self.entries[entry["code"]] = entry
+        except OSError:
+            return False
+        return self.run is not None
+
+    def resumable(self, klines_days: int) -> bool:
+        """存在未完成且下载天数一致的上一次运行"""
+        return self.run is not None and not self.finished and self.klines_days == klines_days
+
+    def start(self, klines_days: int):
+        """开始新一次下载, 覆盖旧日志"""
+        self.run = datetime.now().isoformat()
+        self.klines_days = klines_days
+        self.finished = False
+        self.entries = {}
+        self._buffer = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"run": self.run, "klines_days": klines_days}) + "\n")
+
+    def _exhausted(self, entry) -> bool:
+        return entry["status"] == "failed" and entry.get("attempts", 1) >= self.max_retries
+
+    def pending(self, codes, has_kline) -> list:
+        """需要(重新)下载的代码: 未记录、失败且未用尽重试次数、或已完成但本地存储缺失"""
+        todo = []
+        for code in codes:
+            entry = self.entries.get(code)
+            if not entry:
+                todo.append(code)
+            elif entry["status"] == "done":
+                if not has_kline(code):
+                    todo.append(code)
+            elif not self._exhausted(entry):
+                todo.append(code)
+        return todo
+
+    def record(self, code: str, status: str, date: str = ""):
+        """暂存一条进度, commit() 时写入; 失败时累计本次运行中的失败次数"""
+        entry = {"code": code, "status": status, "date": date}
+        if status == "failed":
+            prev = self.entries.get(code)
+            entry["attempts"] = (prev.get("attempts", 1) if prev and prev["status"] == "failed" else 0) + 1
+        self.entries[code] = entry
+        self._buffer.append(entry)
+
+    def commit(self):
+        """将暂存进度追加写入并落盘; 调用前须保证对应K线已写入存储"""
+        if not self._buffer:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in self._buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self._buffer = []
+
+    def finish(self):
+        self.commit()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"finished": datetime.now().isoformat()}) + "\n")
+        self.finished = True
+
+    def counts(self) -> tuple:
+        """(已完成数, 失败数)"""
+        statuses = [e["status"] for e in self.entries.values()]
+        return statuses.count("done"), statuses.count("failed")
+
+    def retryable(self) -> int:
+        """仍可重试的失败数; 为0时本次运行可标记完成"""
+        return sum(1 for e in self.entries.values() if e["status"] == "failed" and not self._exhausted(e))
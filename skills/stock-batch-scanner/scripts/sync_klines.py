@@ -3,6 +3,7 @@
 K线数据同步脚本
 --init:   首次全量下载全A股K线到本地缓存 (~50分钟, 一次性)
 --update: 每日增量更新，追加当日收盘数据 (~30秒)
+--migrate: 将JSON缓存迁移为列式存储 (config.json 中 data_source 设为 "columnar" 后生效)
 """
 
 import sys
@@ -10,64 +11,107 @@ import io
 import json
 import time
 import argparse
-import requests
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 SKILL_DIR = SCRIPT_DIR.parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
 from data_provider import DataProvider, load_config
-from _import_helper import fetch_kline_eastmoney
+from _import_helper import fetch_kline_eastmoney, http_get, default_scheduler, CircuitOpenError
+from async_downloader import download
+from sync_journal import SyncJournal, JOURNAL_FILE
+from sync_planner import weekdays_between, plan_gaps, missing_bars
+
+
+CLIST_URL = "https://push2.eastmoney.com/api/qt/clist/get"
+CLIST_TIMEOUT = (3.05, 15)
+CLIST_PAGE_SIZE = 5000
+CLIST_WORKERS = 8
+# 沪深两市 A 股的 clist 过滤条件
+STOCK_LIST_FS = ["m:0+t:6,m:0+t:13,m:0+t:80", "m:1+t:2,m:1+t:23"]
+KLINE_URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
+
+
+def configure_api(config: dict):
+    """按配置调整共享请求调度层: 单主机并发上限、重试次数、超时"""
+    timeout = config.get("api_timeout")
+    default_scheduler().configure(
+        max_concurrency=config.get("api_concurrency", 16),
+        retries=config.get("api_retries"),
+        timeout=tuple(timeout) if isinstance(timeout, list) else timeout,
+    )
 
 
 def fetch_all_stock_list():
     """
     获取全A股票列表 (沪深主板+创业板+科创板)
-    优先用push2 clist API，失败时回退到腾讯财经批量报价
+    优先用push2 clist API，失败或熔断时回退到腾讯财经批量报价
     """
-    stocks = _fetch_stock_list_eastmoney()
-    if len(stocks) > 100:
-        return stocks
+    if default_scheduler().available(CLIST_URL):
+        stocks = _fetch_stock_list_eastmoney()
+        if len(stocks) > 100:
+            return stocks
     print("  ⚠ push2 API不可用，回退到腾讯财经接口获取股票列表...")
     return _fetch_stock_list_tencent()
 
 
+def _fetch_clist(fs_list: list, fields: str) -> list:
+    """
+    并行分页获取 push2 clist: 各市场第一页并发请求, 由返回的 total 和实际页大小
+    (服务端可能限制 pz) 算出其余页, 两个市场的剩余页再一起并发请求。
+    返回全部 diff 条目; 单页失败只告警, push2 熔断时抛出 CircuitOpenError。
+    """
+    def fetch_page(item):
+        fs, page = item
+        params = {
+            "pn": page,
+            "pz": CLIST_PAGE_SIZE,
+            "po": 1,
+            "np": 1,
+            "fltt": 2,
+            "invt": 2,
+            "fs": fs,
+            "fields": fields,
+        }
+        try:
+            resp = http_get(CLIST_URL, params=params, timeout=CLIST_TIMEOUT)
+            data = resp.json().get("data") or {}
+            return {"diff": data.get("diff") or [], "total": data.get("total") or 0}
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"  ⚠ 分页获取失败 (fs={fs}, page={page}): {e}")
+            return {"diff": [], "total": 0}
+
+    with ThreadPoolExecutor(max_workers=CLIST_WORKERS) as executor:
+        firsts = list(executor.map(fetch_page, [(fs, 1) for fs in fs_list]))
+        rest = []
+        for fs, first in zip(fs_list, firsts):
+            size = len(first["diff"])
+            if size:
+                pages = -(-first["total"] // size)
+                rest += [(fs, page) for page in range(2, pages + 1)]
+        items = [item for first in firsts for item in first["diff"]]
+        for result in executor.map(fetch_page, rest):
+            items.extend(result["diff"])
+    return items
+
+
 def _fetch_stock_list_eastmoney():
+    try:
+        items = _fetch_clist(STOCK_LIST_FS, "f12,f14")
+    except CircuitOpenError:
+        print("  ⚠ push2 API熔断, 放弃本次列表")
+        return {}
     stocks = {}
-    for market_id in [0, 1]:
-        page = 1
-        while True:
-            url = "https://push2.eastmoney.com/api/qt/clist/get"
-            params = {
-                "pn": page,
-                "pz": 5000,
-                "po": 1,
-                "np": 1,
-                "fltt": 2,
-                "invt": 2,
-                "fs": f"m:{market_id}+t:6,m:{market_id}+t:13,m:{market_id}+t:80" if market_id == 0 else f"m:{market_id}+t:2,m:{market_id}+t:23",
-                "fields": "f12,f14",
-            }
-            try:
-                resp = requests.get(url, params=params, timeout=15)
-                data = resp.json()
-                diff = data.get("data", {}).get("diff", [])
-                if not diff:
-                    break
-                for item in diff:
-                    code = str(item.get("f12", ""))
-                    name = str(item.get("f14", ""))
-                    if _is_valid_a_share(code, name):
-                        stocks[code] = name
-                if len(diff) < 5000:
-                    break
-                page += 1
-            except Exception as e:
-                print(f"  ⚠ 获取股票列表失败 (market={market_id}, page={page}): {e}")
-                break
+    for item in items:
+        code = str(item.get("f12", ""))
+        name = str(item.get("f14", ""))
+        if _is_valid_a_share(code, name):
+            stocks[code] = name
     return stocks
 
 
@@ -91,7 +135,7 @@ def _fetch_stock_list_tencent():
         batch = code_ranges[batch_start : batch_start + batch_size]
         url = "https://qt.gtimg.cn/q=" + ",".join(batch)
         try:
-            resp = requests.get(url, timeout=10)
+            resp = http_get(url)
             if resp.status_code != 200:
                 continue
             for line in resp.text.strip().split(";"):
@@ -108,12 +152,14 @@ def _fetch_stock_list_tencent():
                     continue
                 if _is_valid_a_share(code, name):
                     stocks[code] = name
+        except CircuitOpenError:
+            print("  ⚠ 腾讯财经接口熔断, 股票列表不完整")
+            break
         except Exception:
             continue
 
         if batch_start % 5000 == 0 and batch_start > 0:
             print(f"  已扫描 {batch_start}/{len(code_ranges)} 代码, 发现 {len(stocks)} 只股票")
-            time.sleep(0.1)
 
     return stocks
 
@@ -123,68 +169,46 @@ def fetch_all_realtime_batch():
     批量获取全A股今日收盘数据 (用于增量更新)
     优先用push2 clist API，失败时回退到腾讯批量报价
     """
-    results = _fetch_realtime_eastmoney()
-    if len(results) > 100:
-        return results
+    if default_scheduler().available(CLIST_URL):
+        results = _fetch_realtime_eastmoney()
+        if len(results) > 100:
+            return results
     print("  ⚠ push2 API不可用，回退到腾讯财经批量报价...")
     return _fetch_realtime_tencent()
 
 
 def _fetch_realtime_eastmoney():
-    results = []
-    for fs_str in [
-        "m:0+t:6,m:0+t:13,m:0+t:80",
-        "m:1+t:2,m:1+t:23",
-    ]:
-        page = 1
-        while True:
-            url = "https://push2.eastmoney.com/api/qt/clist/get"
-            params = {
-                "pn": page,
-                "pz": 5000,
-                "po": 1,
-                "np": 1,
-                "fltt": 2,
-                "invt": 2,
-                "fs": fs_str,
-                "fields": "f12,f14,f2,f15,f16,f17,f3,f5,f6,f7,f8",
-            }
-            try:
-                resp = requests.get(url, params=params, timeout=15)
-                data = resp.json()
-                diff = data.get("data", {}).get("diff", [])
-                if not diff:
-                    break
-                today = datetime.now().strftime("%Y-%m-%d")
-                for item in diff:
-                    code = str(item.get("f12", ""))
-                    name = str(item.get("f14", ""))
-                    if not _is_valid_a_share(code, name):
-                        continue
-                    close = item.get("f2")
-                    if close is None or close == "-":
-                        continue
-                    results.append({
-                        "code": code,
-                        "name": name,
-                        "date": today,
-                        "open": _safe_float(item.get("f17")),
-                        "close": _safe_float(close),
-                        "high": _safe_float(item.get("f15")),
-                        "low": _safe_float(item.get("f16")),
-                        "volume": int(item.get("f5", 0) or 0),
-                        "amount": _safe_float(item.get("f6")),
-                        "change_pct": _safe_float(item.get("f3")),
-                        "amplitude": _safe_float(item.get("f7")),
-                        "turnover": _safe_float(item.get("f8")),
-                    })
-                if len(diff) < 5000:
-                    break
-                page += 1
-            except Exception as e:
-                print(f"  ⚠ 批量获取失败 (page={page}): {e}")
-                break
-    return results
+    try:
+        items = _fetch_clist(STOCK_LIST_FS, "f12,f14,f2,f15,f16,f17,f3,f5,f6,f7,f8")
+    except CircuitOpenError:
+        print("  ⚠ push2 API熔断, 放弃本次截面")
+        return []
+    today = datetime.now().strftime("%Y-%m-%d")
+    # 分页按涨跌幅排序, 盘中翻页可能重复, 按代码去重
+    results = {}
+    for item in items:
+        code = str(item.get("f12", ""))
+        name = str(item.get("f14", ""))
+        if not _is_valid_a_share(code, name):
+            continue
+        close = item.get("f2")
+        if close is None or close == "-":
+            continue
+        results[code] = {
+            "code": code,
+            "name": name,
+            "date": today,
+            "open": _safe_float(item.get("f17")),
+            "close": _safe_float(close),
+            "high": _safe_float(item.get("f15")),
+            "low": _safe_float(item.get("f16")),
+            "volume": int(item.get("f5", 0) or 0),
+            "amount": _safe_float(item.get("f6")),
+            "change_pct": _safe_float(item.get("f3")),
+            "amplitude": _safe_float(item.get("f7")),
+            "turnover": _safe_float(item.get("f8")),
+        }
+    return list(results.values())
 
 
 def _fetch_realtime_tencent():
@@ -208,7 +232,7 @@ def _fetch_realtime_tencent():
             prefixed.append(f"{prefix}{c}")
         url = "https://qt.gtimg.cn/q=" + ",".join(prefixed)
         try:
-            resp = requests.get(url, timeout=10)
+            resp = http_get(url)
             for line in resp.text.strip().split(";"):
                 line = line.strip()
                 if not line or "~" not in line:
@@ -235,6 +259,9 @@ def _fetch_realtime_tencent():
                     "amplitude": _safe_float(parts[43]),
                     "turnover": _safe_float(parts[38]),
                 })
+        except CircuitOpenError:
+            print("  ⚠ 腾讯财经接口熔断, 截面不完整")
+            break
         except Exception:
             continue
 
@@ -260,65 +287,165 @@ def _is_valid_a_share(code: str, name: str) -> bool:
     return True
 
 
-def init_full_download(provider: DataProvider, config: dict):
-    """首次全量下载"""
-    threads = config.get("api_threads", 5)
-    delay = config.get("api_delay", 0.5)
-    klines_days = config.get("klines_days", 70)
+def api_rate(config: dict):
+    """批量K线下载的可选硬限速 (次/秒); 未配置时不限速, 并发由请求调度层按上游状况自适应"""
+    return config.get("api_rate")
 
-    print("📋 Step 1: 获取全A股票列表...")
-    stocks = fetch_all_stock_list()
-    print(f"  ✅ 获取到 {len(stocks)} 只股票")
-    provider.save_stock_list(stocks)
 
-    print(f"\n📈 Step 2: 下载K线数据 ({len(stocks)}只, {threads}线程)...")
-    codes = list(stocks.keys())
+def init_full_download(provider: DataProvider, config: dict, fresh: bool = False):
+    """
+    首次全量下载: 异步下载器在途请求不超过 api_concurrency, 实际并发由请求调度层按上游延迟/错误率自适应
+    (配置 api_rate 时另加全局令牌桶硬限速), 每只股票到达即写入存储。
+    进度记录在工作日志 (sync_journal.jsonl), 每 journal_checkpoint 只落盘一次;
+    中断后重跑从日志续传, 只下载未完成与失败 (未超过重试次数) 的股票。fresh=True 时忽略日志从头下载。
+    """
+    klines_days = config.get("klines_days", 70)
+    rate = api_rate(config)
+    concurrency = config.get("api_concurrency", 16)
+    checkpoint = config.get("journal_checkpoint", 200)
+
+    journal = SyncJournal(provider.cache_dir / JOURNAL_FILE, config.get("journal_max_retries", 3))
+    resume = not fresh and journal.load() and journal.resumable(klines_days)
+    stocks = provider.get_stock_list() if resume else {}
+
+    if stocks:
+        ok, bad = journal.counts()
+        print(f"📋 Step 1: 续传 {journal.run} 开始的下载 (已完成{ok}, 失败{bad}), 沿用已保存的股票列表")
+    else:
+        print("📋 Step 1: 获取全A股票列表...")
+        stocks = fetch_all_stock_list()
+        print(f"  ✅ 获取到 {len(stocks)} 只股票")
+        provider.save_stock_list(stocks)
+        journal.start(klines_days)
+
+    codes = journal.pending(list(stocks.keys()), provider.has_kline)
+    skipped = len(stocks) - len(codes)
+    print(f"\n📈 Step 2: 下载K线数据 ({len(codes)}只{f', 跳过已完成{skipped}只' if skipped else ''}, "
+          f"并发≤{concurrency} 自适应{f', 限速{rate:g}次/秒' if rate else ''})...")
     done = 0
     failed = 0
     total = len(codes)
     start_time = time.time()
 
-    def download_one(code):
-        nonlocal delay
-        result = fetch_kline_eastmoney(code, "daily", klines_days)
-        if delay > 0:
-            time.sleep(delay)
-        return code, result
-
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        futures = {executor.submit(download_one, c): c for c in codes}
-        for future in as_completed(futures):
-            code = futures[future]
-            done += 1
-            try:
-                code, result = future.result()
-                if result and "klines" in result and result["klines"]:
-                    name = result.get("name", stocks.get(code, ""))
-                    provider.save_kline(code, name, result["klines"])
-                else:
-                    failed += 1
-            except Exception:
-                failed += 1
-
-            if done % 100 == 0 or done == total:
-                elapsed = time.time() - start_time
-                speed = done / elapsed if elapsed > 0 else 0
-                eta = (total - done) / speed if speed > 0 else 0
-                print(f"  [{done}/{total}] {done*100//total}% | "
-                      f"失败{failed} | {speed:.1f}只/秒 | ETA {eta/60:.1f}分钟")
+    def fetch_one(code):
+        return fetch_kline_eastmoney(code, "daily", klines_days)
 
+    def on_result(code, result):
+        nonlocal done, failed
+        done += 1
+        if result and "klines" in result and result["klines"]:
+            provider.save_kline(code, result.get("name", stocks.get(code, "")), result["klines"])
+            journal.record(code, "done", result["klines"][-1]["date"])
+        else:
+            failed += 1
+            journal.record(code, "failed")
+        if done % checkpoint == 0:
+            # 先落盘K线再写日志, 日志中的"完成"总是已持久化的; 只写分段, 主段在结束时重写一次
+            provider.checkpoint()
+            journal.commit()
+        if done % 100 == 0 or done == total:
+            elapsed = time.time() - start_time
+            speed = done / elapsed if elapsed > 0 else 0
+            eta = (total - done) / speed if speed > 0 else 0
+            limit = default_scheduler().stats(KLINE_URL)["limit"]
+            print(f"  [{done}/{total}] {done*100//total}% | "
+                  f"失败{failed} | {speed:.1f}只/秒 | 并发{limit:g} | ETA {eta/60:.1f}分钟")
+
+    if codes:
+        try:
+            download(codes, fetch_one, on_result, rate=rate, concurrency=concurrency)
+        except KeyboardInterrupt:
+            provider.checkpoint()
+            journal.commit()
+            print(f"\n⏸ 已中断, 进度已保存 ({done}/{total}), 重新运行 --init 将续传")
+            raise
+
+    provider.flush()
+    journal.commit()
+    ok, bad = journal.counts()
     elapsed = time.time() - start_time
+    retryable = journal.retryable()
+    if retryable == 0:
+        journal.finish()
     provider.update_sync_meta(
         last_full_sync=datetime.now().isoformat(),
-        stock_count=total,
-        failed_count=failed,
+        stock_count=len(stocks),
+        failed_count=bad,
         elapsed_seconds=round(elapsed),
     )
-    print(f"\n✅ 全量下载完成: {total - failed}/{total} 成功, 耗时 {elapsed/60:.1f} 分钟")
+    print(f"\n✅ 全量下载完成: {ok}/{len(stocks)} 成功, 本次下载{total}只, 耗时 {elapsed/60:.1f} 分钟")
+    if retryable:
+        print(f"  ⚠ {retryable} 只失败, 重新运行 --init 将只重试这些股票")
+    if bad > retryable:
+        print(f"  ⚠ {bad - retryable} 只连续失败{journal.max_retries}次, 不再重试")
+
+
+def fetch_trading_calendar(since: str, today: str, config: dict) -> list:
+    """参考指数日K线的日期序列 (覆盖 since 之后), 失败返回空列表"""
+    limit = min(weekdays_between(since, today) + 2, config.get("klines_days", 70) + 30)
+    result = fetch_kline_eastmoney(config.get("calendar_ref", "sh000001"), "daily", limit)
+    return [k["date"] for k in result.get("klines", [])]
+
+
+def backfill_gaps(provider: DataProvider, config: dict, dailies: dict, names: dict) -> tuple:
+    """
+    按交易日历补齐漏同步的交易日: 缺口相同的股票一组, lmt 取缺口+1, 每只一次请求;
+    缺口超出日历覆盖的股票整体重新下载。当日截面日期校正为最新交易日 (周末/节假日运行时)。
+    返回 (backfill {date: {code: record}}, 重新下载数); 无法获取日历时返回 ({}, 0), 只追加当日截面。
+    """
+    last_dates = provider.last_dates()
+    known = [last_dates[c] for c in dailies if last_dates.get(c)]
+    if not known or not config.get("backfill", True):
+        return {}, 0
+    snapshot_date = next(iter(dailies.values()))["date"]
+    calendar = [d for d in fetch_trading_calendar(min(known), snapshot_date, config) if d <= snapshot_date]
+    if not calendar:
+        print("  ⚠ 获取交易日历失败, 仅追加当日数据")
+        return {}, 0
+    trade_day = calendar[-1]
+    if snapshot_date != trade_day:
+        print(f"  📅 {snapshot_date} 非交易日, 截面按最新交易日 {trade_day} 记录")
+        for rec in dailies.values():
+            rec["date"] = trade_day
+
+    gaps, reload = plan_gaps(last_dates, dailies, calendar)
+    items = [(code, gap + 1) for gap in sorted(gaps) for code in gaps[gap]]
+    items += [(code, config.get("klines_days", 70)) for code in reload]
+    if not items:
+        return {}, 0
+    print(f"🧩 补齐缺口: {', '.join(f'缺{g}日 {len(gaps[g])}只' for g in sorted(gaps))}"
+          f"{f', 重新下载 {len(reload)}只' if reload else ''}")
+
+    reload_set = set(reload)
+    backfill = {}
+    failed = 0
+
+    def fetch_one(item):
+        code, limit = item
+        return fetch_kline_eastmoney(code, "daily", limit)
+
+    def on_result(item, result):
+        nonlocal failed
+        code = item[0]
+        klines = result.get("klines") if result else None
+        if not klines:
+            failed += 1
+        elif code in reload_set:
+            provider.save_kline(code, names.get(code, ""), [k for k in klines if k["date"] < trade_day])
+        else:
+            for k in missing_bars(klines, last_dates[code], trade_day):
+                backfill.setdefault(k["date"], {})[code] = k
+
+    download(items, fetch_one, on_result, rate=api_rate(config), concurrency=config.get("api_concurrency", 16))
+    provider.flush()
+    if failed:
+        print(f"  ⚠ {failed} 只补齐失败, 下次 --update 重试")
+    return backfill, len(reload)
 
 
 def update_daily(provider: DataProvider):
-    """每日增量更新"""
+    """每日增量更新: 先按交易日历补齐缺口, 再追加当日截面"""
+    config = provider.config
     print("📊 获取今日全A股收盘数据...")
     records = fetch_all_realtime_batch()
     print(f"  ✅ 获取到 {len(records)} 只股票数据")
@@ -327,11 +454,9 @@ def update_daily(provider: DataProvider):
         print("  ⚠ 无数据，可能非交易日或未收盘")
         return
 
-    updated = 0
-    new_stocks = 0
+    dailies = {}
     for rec in records:
-        code = rec["code"]
-        daily = {
+        dailies[rec["code"]] = {
             "date": rec["date"],
             "open": rec["open"],
             "close": rec["close"],
@@ -344,13 +469,21 @@ def update_daily(provider: DataProvider):
             "turnover": rec.get("turnover", 0),
             "change": round(rec["close"] - rec["open"], 2) if rec["close"] and rec["open"] else 0,
         }
-        cache_file = provider.klines_dir / f"{code}.json"
-        if cache_file.exists():
-            provider.append_daily(code, daily)
-            updated += 1
-        else:
-            provider.save_kline(code, rec["name"], [daily])
-            new_stocks += 1
+    names = {rec["code"]: rec["name"] for rec in records}
+    new_stocks = sum(1 for code in dailies if not provider.has_kline(code))
+    updated = len(dailies) - new_stocks
+
+    # 在写入任何数据前判断指标状态是否与上次同步一致
+    state = provider.indicator_state()
+    state_fresh = state is not None and state.load(provider.sync_stamp(), config.get("klines_days", 70))
+
+    backfill, reloaded = backfill_gaps(provider, config, dailies, names)
+    for date_str in sorted(backfill):
+        provider.save_daily_partition(date_str, backfill[date_str])
+        provider.append_daily_batch(backfill[date_str], names)
+    provider.save_daily_partition(next(iter(dailies.values()))["date"], dailies)
+    provider.append_daily_batch(dailies, names)
+    provider.flush()
 
     stock_list = provider.get_stock_list()
     for rec in records:
@@ -362,8 +495,34 @@ def update_daily(provider: DataProvider):
         last_update=datetime.now().isoformat(),
         last_update_count=updated,
         new_stocks=new_stocks,
+        backfill_days=len(backfill),
     )
-    print(f"✅ 增量更新完成: 更新{updated}只, 新增{new_stocks}只")
+    print(f"✅ 增量更新完成: 更新{updated}只, 新增{new_stocks}只"
+          f"{f', 补齐{len(backfill)}个交易日' if backfill else ''}")
+
+    # 整体重新下载的股票窗口无法增量平移, 交由下次扫描重建状态
+    if state_fresh and not reloaded:
+        count = 0
+        for day in [backfill[d] for d in sorted(backfill)] + [dailies]:
+            count = state.update(day, names, provider.sync_stamp())
+        state.save()
+        print(f"⚡ 增量指标状态已更新: {count}只")
+    elif state is not None:
+        print("💡 增量指标状态缺失或已过期, 下次扫描时完整加载并重建")
+
+
+def migrate_to_columnar(provider: DataProvider):
+    """JSON缓存 → 列式存储"""
+    if not provider.klines_dir.is_dir():
+        print(f"  ⚠ 未找到JSON缓存目录 {provider.klines_dir}")
+        return
+    print(f"📦 迁移JSON缓存 → 列式存储 ({provider.store.root})...")
+    start = time.time()
+    count = provider.migrate_to_columnar()
+    provider.update_sync_meta(last_migrate=datetime.now().isoformat(), migrate_count=count)
+    print(f"✅ 迁移完成: {count}只, 耗时 {time.time()-start:.1f}秒")
+    if provider.cache_backend != "columnar":
+        print('💡 在 config.json 中设置 "data_source": "columnar" 以启用列式存储')
 
 
 def main():
@@ -371,16 +530,21 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--init", action="store_true", help="首次全量下载 (~50分钟)")
     group.add_argument("--update", action="store_true", help="每日增量更新 (~30秒)")
+    group.add_argument("--migrate", action="store_true", help="JSON缓存迁移为列式存储")
+    parser.add_argument("--fresh", action="store_true", help="--init 时忽略工作日志, 从头全量下载")
     parser.add_argument("--config", default=None, help="配置文件路径")
     args = parser.parse_args()
 
     config = load_config(args.config)
     provider = DataProvider(args.config)
+    configure_api(config)
 
     if args.init:
-        init_full_download(provider, config)
+        init_full_download(provider, config, fresh=args.fresh)
     elif args.update:
         update_daily(provider)
+    elif args.migrate:
+        migrate_to_columnar(provider)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+增量同步缺口规划
+update_daily 只追加当日截面, 漏跑的交易日会永久缺失。这里按交易日历比较每只股票的本地最新日期:
+- 交易日历取自参考指数 (默认上证指数 sh000001) 的日K线, 一次请求
+- 缺口 = 本地最新日期与最新交易日之间缺少的交易日数
+- 缺口相同的股票归为一组, 按缺口大小设置 lmt 请求, 每只股票一次请求补齐
+- 缺口超出日历覆盖范围 (长期未同步) 的股票整体重新下载
+停牌股票不在当日截面中, 不参与规划。
+"""
+
+from datetime import date, timedelta
+
+
+def weekdays_between(start: str, end: str) -> int:
+    """(start, end] 之间的工作日数, 作为交易日数的上界"""
+    d0 = date.fromisoformat(start)
+    d1 = date.fromisoformat(end)
+    days = 0
+    d = d0 + timedelta(days=1)
+    while d <= d1:
+        if d.weekday() < 5:
+            days += 1
+        d += timedelta(days=1)
+    return days
+
+
+def plan_gaps(last_dates: dict, codes, calendar: list) -> tuple:
+    """
+    calendar: 升序交易日列表, 末项为最新交易日 (当日截面对应的交易日)。
+    返回 (gaps, reload): gaps 为 {缺口交易日数: [code]}, reload 为需整体重新下载的代码。
+    本地无数据的代码不在其中 (由当日截面新建)。
+    """
+    session = calendar[-1]
+    position = {d: i for i, d in enumerate(calendar)}
+    gaps = {}
+    reload = []
+    for code in codes:
+        last = last_dates.get(code)
+        if not last or last >= session:
+            continue
+        if last < calendar[0]:
+            reload.append(code)
+            continue
+        i = position.get(last)
+        if i is None:
+            # 本地最新日期不是交易日 (如周末抓取的截面), 按其后的第一个交易日计
+            i = next(j for j, d in enumerate(calendar) if d > last) - 1
+        gap = len(calendar) - 2 - i
+        if gap > 0:
+            gaps.setdefault(gap, []).append(code)
+    return gaps, reload
+
+
+def missing_bars(klines: list, last: str, session: str) -> list:
+    """从补齐请求的K线中取 (last, session) 之间的交易日; 最新交易日仍以当日截面为准"""
+    return [k for k in klines if last < k["date"] < session]
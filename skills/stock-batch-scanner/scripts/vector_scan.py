@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+全市场向量化三重筛选
+将全市场K线按位置右对齐为 (stocks × bars) 矩阵 (历史不足的左侧为NaN),
+筛选条件均以整矩阵布尔掩码计算, 只对最终通过的股票构造结果字典。
+条件由 screen_rules 的规则组合而成, 缺省的三重筛选 (涨停 / 多头排列 / 右侧买点) 判定规则与
+batch_scanner 中逐股的 has_limit_up / is_multi_head / is_right_side_buy 一致 (scan_stock 需传入股票名称,
+ST 股按5%涨停), 涨停按板块涨停价判定 (limit_price)。
+
+筛选按阶段链执行: 每个阶段只在上一阶段的幸存行上求值, 指标 (均线、涨停命中) 由 MarketFrame
+按需计算并缓存, 各阶段与评分共用, 不重复计算; 每阶段的通过数与耗时随结果输出。
+"""
+
+import heapq
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from data_provider import KlineSeries
+from indicators import prefix_sum_2d, window_mean_2d
+from kline_store import format_date, records_to_columns
+from limit_price import limit_ratios, limit_up_mask
+from screen_rules import compile_screen, evaluate_stage
+
+
+MATRIX_FIELDS = ("date", "open", "close", "low", "change_pct", "turnover")
+
+
+def _columns_of(klines) -> dict:
+    if isinstance(klines, KlineSeries):
+        return klines.columns
+    if isinstance(klines, dict):
+        return klines
+    return records_to_columns(klines, MATRIX_FIELDS)
+
+
+def align_market(all_klines: dict, bars: int = None) -> tuple:
+    """
+    {code: K线} → (codes, {字段: (stocks × bars) 矩阵}, lengths)
+    bars 缺省为最长序列长度; 价格类字段左侧补NaN, date 补0。
+    """
+    codes = list(all_klines)
+    columns = [_columns_of(all_klines[c]) for c in codes]
+    lengths = np.array([len(c["date"]) for c in columns], dtype=np.int64)
+    if bars is None:
+        bars = int(lengths.max()) if len(lengths) else 0
+    lengths = np.minimum(lengths, bars)
+    mats = {
+        name: np.zeros((len(codes), bars), dtype=np.int32) if name == "date"
+        else np.full((len(codes), bars), np.nan)
+        for name in MATRIX_FIELDS
+    }
+    for i, cols in enumerate(columns):
+        n = lengths[i]
+        if not n:
+            continue
+        for name in MATRIX_FIELDS:
+            col = cols.get(name)
+            if col is not None:
+                mats[name][i, bars - n:] = col[-n:]
+            elif name != "date":
+                mats[name][i, bars - n:] = 0.0
+    return codes, mats, lengths
+
+
+def _or_none(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class MarketFrame:
+    """对齐后的全市场矩阵, 以及按需计算、缓存的指标, 供筛选各阶段与评分共享"""
+
+    def __init__(self, all_klines: dict, bars: int = None, names: dict = None):
+        self.codes, self.mats, self.lengths = align_market(all_klines, bars)
+        self.names = names or {}
+        self._cache = {}
+
+    @classmethod
+    def from_state(cls, state, names: dict = None) -> "MarketFrame":
+        """
+        由增量指标状态 (indicator_state) 构造, 不加载K线: 窗口矩阵直接取自状态,
+        最新 MA、近期 MA20 与涨停矩阵预置到缓存, 筛选与评分按查表取值。
+        """
+        frame = cls.__new__(cls)
+        frame.codes, frame.mats, frame.lengths = list(state.codes), dict(state.mats), state.lengths
+        frame.names = names or {}
+        frame._cache = {("ma_back", p, 0): state.ma_now(p) for p in state.sums}
+        for k in range(state.ma20.shape[1]):
+            frame._cache[("ma_back", 20, k)] = state.ma20[:, -(k + 1)]
+        frame._cache["limit_up"] = state.limit
+        return frame
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def ma(self, period: int) -> np.ndarray:
+        """(stocks, bars - period + 1) 均值矩阵, 所有周期共用一次按行累加和"""
+        prefix = self._cached("prefix", lambda: prefix_sum_2d(self.mats["close"]))
+        return self._cached(("ma", period), lambda: window_mean_2d(*prefix, period))
+
+    def ma_back(self, period: int, k: int = 0) -> np.ndarray:
+        """每只股票 k 日前的 MA 值, 不足时为NaN"""
+        def compute():
+            series = self.ma(period)
+            if series.shape[1] > k:
+                return series[:, -(k + 1)]
+            return np.full(len(self.codes), np.nan)
+        return self._cached(("ma_back", period, k), compute)
+
+    def last(self, name: str) -> np.ndarray:
+        mat = self.mats[name]
+        return mat[:, -1] if mat.shape[1] else np.full(len(self.codes), np.nan)
+
+    def limit_up(self) -> np.ndarray:
+        """逐日是否涨停 (stocks × bars), 按各股所属板块 / ST 状态的涨停价判定"""
+        def compute():
+            ratios = limit_ratios(self.codes, self.names)
+            return limit_up_mask(self.mats["close"], self.mats["change_pct"], ratios)
+        return self._cached("limit_up", compute)
+
+    def limit_hits(self, lookback: int, threshold: float = None) -> np.ndarray:
+        """
+        回溯窗口内逐日是否涨停 (stocks × window)。
+        threshold 缺省按板块涨停价判定; 给出时按 涨幅 >= threshold (%) 判定。
+        """
+        def compute():
+            if threshold is None:
+                hits = self.limit_up()
+                return hits[:, -lookback:] if lookback else hits
+            pct = self.mats["change_pct"]
+            window = pct[:, -lookback:] if lookback else pct
+            with np.errstate(invalid="ignore"):
+                return window >= threshold
+        return self._cached(("limit_hits", lookback, threshold), compute)
+
+
+def run_stages(frame: MarketFrame, lookback: int = 40, screen: dict = None) -> tuple:
+    """
+    按编译后的筛选规则依次执行各阶段, 每阶段只在上一阶段幸存的行上求值。
+    screen 为 config.json 的 "screen" 配置, 缺省为三重筛选。
+    返回 (最终幸存行号, [{"stage", "count", "seconds", "rules"}])
+    """
+    compiled = compile_screen(screen, lookback)
+    start = time.perf_counter()
+    rows = np.flatnonzero(frame.lengths >= compiled["min_bars"])
+    timings = [{"stage": "eligible", "count": len(rows), "seconds": round(time.perf_counter() - start, 4)}]
+    for stage in compiled["stages"]:
+        start = time.perf_counter()
+        if len(rows):
+            rows = rows[evaluate_stage(frame, rows, stage)]
+        timings.append({
+            "stage": stage["stage"],
+            "count": len(rows),
+            "seconds": round(time.perf_counter() - start, 4),
+            "rules": [item["rule"] for item in stage["rules"]],
+        })
+    return rows, timings
+
+
+def score_rows(frame: MarketFrame, rows: np.ndarray, lookback: int, multi_head, right_side) -> np.ndarray:
+    """
+    对幸存行整体计算综合评分 (规则同 batch_scanner.compute_score), 只用 frame 已缓存的矩阵,
+    不构造结果字典; multi_head / right_side 为各行是否满足对应条件。
+    """
+    limit_count = frame.limit_hits(lookback)[rows].sum(axis=1)
+    ma20, ma20_5d_ago, ma60 = frame.ma_back(20)[rows], frame.ma_back(20, 5)[rows], frame.ma_back(60)[rows]
+    close = frame.mats["close"][rows]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valid = ~np.isnan(ma20) & ~np.isnan(ma20_5d_ago) & (ma20 != 0) & (ma20_5d_ago != 0)
+        slope = np.where(valid, np.round((ma20 - ma20_5d_ago) / ma20_5d_ago * 100, 2), 0.0)
+        change_5d = (close[:, -1] / close[:, -6] - 1) * 100 if close.shape[1] >= 6 else np.full(len(rows), np.nan)
+        score = np.minimum(limit_count * 15, 30).astype(np.float64)
+        score += np.where(multi_head, 25 + np.where(~np.isnan(ma60) & (ma60 != 0), 5, 0), 0)
+        score += np.where(right_side, 25 + np.where(slope > 1, np.minimum(slope * 2, 10), 0), 0)
+        score += np.where((change_5d > 5) & (change_5d < 25), 5, 0)
+    return np.round(np.minimum(score, 100), 1)
+
+
+def build_result(frame: MarketFrame, i: int, lookback: int, score: float) -> dict:
+    """为单只入选的股票构造结果 (字段同 batch_scanner.scan_stock), 指标取自 frame 缓存, score 由 score_rows 给出"""
+    mats, length = frame.mats, int(frame.lengths[i])
+    closes = mats["close"][i, -length:].tolist()
+    window_dates = mats["date"][i, -lookback:] if lookback else mats["date"][i]
+    limit_dates = [format_date(int(d)) for d in window_dates[frame.limit_hits(lookback)[i]].tolist()]
+    ma = {p: _or_none(frame.ma_back(p)[i]) for p in (5, 10, 20, 60)}
+    ma60 = ma[60]
+    ma20_now, ma20_5d_ago = ma[20], _or_none(frame.ma_back(20, 5)[i])
+    slope = round((ma20_now - ma20_5d_ago) / ma20_5d_ago * 100, 2) if ma20_now and ma20_5d_ago else 0
+
+    def period_change(n):
+        if len(closes) >= n + 1:
+            return round((closes[-1] / closes[-(n + 1)] - 1) * 100, 2)
+        return 0
+
+    return {
+        "code": frame.codes[i],
+        "price": closes[-1],
+        "change_pct": float(mats["change_pct"][i, -1]),
+        "turnover": float(mats["turnover"][i, -1]),
+        "change_5d": period_change(5),
+        "change_10d": period_change(10),
+        "change_20d": period_change(20),
+        "limit_up_dates": limit_dates,
+        "limit_up_count": len(limit_dates),
+        "ma5": round(ma[5], 3) if ma[5] else None,
+        "ma10": round(ma[10], 3) if ma[10] else None,
+        "ma20": round(ma20_now, 3) if ma20_now else None,
+        "ma60": round(ma60, 3) if ma60 else None,
+        "ma20_slope": slope,
+        "score": float(score),
+        "date": format_date(int(mats["date"][i, -1])),
+    }
+
+
+def _score_flags(frame: MarketFrame, rows: np.ndarray, lookback: int, timings: list) -> dict:
+    """评分用的多头排列 / 右侧买点判定: 已作为筛选阶段执行过的直接视为通过, 否则在幸存行上补算"""
+    executed = {t["stage"] for t in timings}
+    flags = {}
+    for stage in compile_screen(None, lookback)["stages"]:
+        if stage["stage"] in ("multi_head", "right_side"):
+            if stage["stage"] in executed:
+                flags[stage["stage"]] = np.ones(len(rows), dtype=bool)
+            else:
+                flags[stage["stage"]] = evaluate_stage(frame, rows, stage) if len(rows) else np.zeros(0, dtype=bool)
+    return flags
+
+
+def scan_market(all_klines: dict, stock_list: dict, lookback: int = 40, screen: dict = None,
+                frame: MarketFrame = None, top: int = None) -> tuple:
+    """
+    向量化筛选 (缺省为三重筛选, screen 见 screen_rules), 返回 (results按评分降序, stats)。
+    stats 含漏斗计数 total 与各阶段通过数, 以及逐阶段 stages 计时。
+    多策略扫描时传入同一个 frame, 对齐矩阵与已算过的指标在策略间共享 (此时 all_klines 不再使用)。
+    给出 top 时先对全部幸存行向量化评分, 以大小为 top 的堆选出前N, 只为入选的股票构造结果字典。
+    """
+    start = time.perf_counter()
+    shared = frame is not None
+    if not shared:
+        frame = MarketFrame(all_klines, names=stock_list)
+    align_seconds = round(time.perf_counter() - start, 4)
+    rows, timings = run_stages(frame, lookback, screen)
+
+    start = time.perf_counter()
+    flags = _score_flags(frame, rows, lookback, timings)
+    scores = score_rows(frame, rows, lookback, flags["multi_head"], flags["right_side"])
+    if top:
+        order = heapq.nlargest(top, range(len(rows)), key=scores.__getitem__)
+    else:
+        order = sorted(range(len(rows)), key=scores.__getitem__, reverse=True)
+    results = []
+    for j in order:
+        i = int(rows[j])
+        result = build_result(frame, i, lookback, scores[j])
+        result["name"] = stock_list.get(frame.codes[i], "")
+        results.append(result)
+    timings.append({"stage": "score", "count": len(results), "seconds": round(time.perf_counter() - start, 4)})
+
+    stats = {"total": len(frame)}
+    stats.update({t["stage"]: t["count"] for t in timings if t["stage"] not in ("eligible", "score")})
+    align = {"stage": "align", "count": len(frame), "seconds": align_seconds}
+    if shared:
+        align["shared"] = True
+    stats["stages"] = [align] + timings
+    return results, stats
+
+
+def _merge_stats(parts: list) -> dict:
+    """按阶段名合并各批次的漏斗计数与耗时 (耗时为各批之和, 即筛选线程的总CPU时间)"""
+    stats = {"total": 0}
+    stages = {}
+    for part in parts:
+        for key, value in part.items():
+            if key == "stages":
+                for t in value:
+                    merged = stages.setdefault(t["stage"], dict(t, count=0, seconds=0.0))
+                    merged["count"] += t["count"]
+                    merged["seconds"] = round(merged["seconds"] + t["seconds"], 4)
+            else:
+                stats[key] = stats.get(key, 0) + value
+    stats["stages"] = list(stages.values())
+    return stats
+
+
+def scan_stream(chunks, stock_list: dict, lookback: int = 40, screen: dict = None,
+                workers: int = 2, top: int = None) -> tuple:
+    """
+    流式筛选: chunks 逐批产出 {code: K线}, 每批到达即提交给有界线程池对齐、筛选,
+    调用方线程同时继续加载下一批; 在途批次不超过 workers * 2 (背压), 峰值内存约为数批K线而非全市场。
+    各股判定只依赖自身K线, 分批结果与整体扫描一致。给出 top 时每批只保留自身前N,
+    结束时按批次顺序合并, 再以堆取全局前N; 否则全量按评分排序。返回 (results, stats)。
+    """
+    compile_screen(screen, lookback)  # 配置错误在加载前暴露
+    parts = {}
+    load_seconds, loaded = 0.0, 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            load_seconds += time.perf_counter() - start
+            if chunk is None:
+                break
+            loaded += len(chunk)
+            future = executor.submit(scan_market, chunk, stock_list, lookback, screen, None, top)
+            pending[future] = len(parts) + len(pending)
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    parts[pending.pop(future)] = future.result()
+        for future, n in pending.items():
+            parts[n] = future.result()
+
+    start = time.perf_counter()
+    ordered = [parts[n] for n in sorted(parts)]
+    candidates = [r for results, _ in ordered for r in results]
+    if top:
+        results = heapq.nlargest(top, candidates, key=lambda x: x["score"])
+    else:
+        results = sorted(candidates, key=lambda x: x["score"], reverse=True)
+    stats = _merge_stats([part for _, part in ordered])
+    stats["stages"].insert(0, {"stage": "load", "count": loaded, "seconds": round(load_seconds, 4)})
+    stats["stages"].append({"stage": "merge", "count": len(results), "seconds": round(time.perf_counter() - start, 4)})
+    return results, stats
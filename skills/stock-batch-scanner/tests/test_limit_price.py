@@ -0,0 +1,78 @@
+"""limit_price: 前复权K线跨除权日时的涨跌停判定"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from limit_price import (  # noqa: E402
+    LIMIT_TOLERANCE, limit_down_mask, limit_down_price, limit_up_mask, limit_up_price, round_to_tick,
+)
+
+
+def _ex_rights(price, dividend: float = 0.0, bonus: float = 1.0):
+    """除权参考价: (价格 - 每股分红) / (1 + 送转比例), 保留两位小数; 默认10送10"""
+    return round_to_tick((np.asarray(price) - dividend) / (1 + bonus))
+
+
+def _series(ratio: float, ex_day: int, days: int = 120, seed: int = 7):
+    """
+    生成不复权收盘价, 并返回 (前复权收盘价, 涨跌幅%, 逐日涨停, 逐日跌停)。
+    ex_day 当日按除权参考价计算涨跌, 约1/4交易日涨停、1/10跌停; 前复权即除权日之前的价格按 _ex_rights 缩放
+    """
+    rng = np.random.default_rng(seed)
+    close = [13.37]
+    pct = [0.0]
+    up = [False]
+    down = [False]
+    for i in range(1, days):
+        prev = float(_ex_rights(close[-1])) if i == ex_day else close[-1]
+        r = rng.random()
+        if r < 0.25:
+            price = float(limit_up_price(prev, ratio))
+        elif r < 0.35:
+            price = float(limit_down_price(prev, ratio))
+        else:
+            price = float(round_to_tick(prev * (1 + rng.uniform(-0.03, 0.03))))
+        close.append(price)
+        pct.append(round((price / prev - 1) * 100, 2))
+        up.append(r < 0.25)
+        down.append(0.25 <= r < 0.35)
+    close = np.array(close)
+    adjusted = close.copy()
+    adjusted[:ex_day] = _ex_rights(close[:ex_day])
+    return adjusted, np.array(pct), np.array(up), np.array(down)
+
+
+def test_forward_adjusted_limit_up_across_ex_rights_date():
+    adjusted, pct, up, _ = _series(0.10, ex_day=90)
+
+    # 前复权价格按价位比较会漏判除权日之前的涨停, 本序列须覆盖这种情况
+    prev = np.r_[np.nan, adjusted[:-1]]
+    with np.errstate(invalid="ignore"):
+        by_price = adjusted >= limit_up_price(prev, 0.10) - LIMIT_TOLERANCE
+    assert (up[:90] & ~by_price[:90]).sum() > 0
+
+    assert np.array_equal(limit_up_mask(adjusted, pct, 0.10), up)
+
+
+def test_unadjusted_limit_up_by_price_alone():
+    adjusted, pct, up, _ = _series(0.10, ex_day=90)
+    # 不复权 (除权日之后) 的区间按价位比较即可精确判断, 不依赖涨跌幅
+    assert np.array_equal(limit_up_mask(adjusted[90:], np.zeros(30), 0.10)[1:], up[91:])
+
+
+def test_forward_adjusted_limit_down_and_board_ratio():
+    for ratio in (0.05, 0.10, 0.20, 0.30):
+        adjusted, pct, up, down = _series(ratio, ex_day=60, seed=int(ratio * 100))
+        assert np.array_equal(limit_up_mask(adjusted, pct, ratio), up)
+        assert np.array_equal(limit_down_mask(adjusted, pct, ratio), down)
+
+
+def test_matrix_rows_use_their_own_ratio():
+    st_close, st_pct, st_up, _ = _series(0.05, ex_day=30, seed=1)
+    gem_close, gem_pct, gem_up, _ = _series(0.20, ex_day=30, seed=2)
+    mask = limit_up_mask(np.vstack([st_close, gem_close]), np.vstack([st_pct, gem_pct]), np.array([0.05, 0.20]))
+    assert np.array_equal(mask, np.vstack([st_up, gem_up]))